@@ -5,14 +5,15 @@ import argparse
 import calendar
 import os.path
 import decimal
-import jinja2
-import pytz
-import json
 import sys
-import csv
 import os
+import traceback
 from io import StringIO
 
+# The modules only needed by some of the subcommands (jinja2, pytz, json,
+# csv, socket, socketserver and the columnar numpy code) are imported when
+# they are used, so that the simple subcommands start quickly
+
 # Ensure that we look for any modules in our local lib dir.  This allows simple
 # testing and development use.  It also does not break the case where the lib
 # has been installed properly on the normal sys.path
@@ -24,7 +25,18 @@ sys.path.insert(0,
 # Stupid pyflake, neither of these imports can be before the sys.path
 from row import Row # noqa
 from row import RowData # noqa
+from row import Filter # noqa
+from row import set_asof # noqa
+from row import row_stats # noqa
 from rowset import RowSet # noqa
+from rowset import index_stats # noqa
+from rowset import group_by_stats # noqa
+from rowset import rowset_stats # noqa
+from rowcache import RowCache # noqa
+from rowcache import cache_dir # noqa
+from tagschema import tagschema_stats # noqa
+from ledger import Ledger # noqa
+import timing # noqa
 
 FILES_DIR = 'cash'
 
@@ -36,6 +48,8 @@ def _iso8601_str(dt):
     """Why oh why is this so hard to do?
     """
 
+    import pytz
+
     # TODO:
     # - currently, we want to report any timestamp in HKT, but if this code is
     #   to be reused, that needs to become flexible
@@ -44,6 +58,41 @@ def _iso8601_str(dt):
     return dt.replace(microsecond=0).isoformat()
 
 
+def _parse_date(string):
+    """Used as an argparse type to read a YYYY-MM-DD date"""
+    return datetime.datetime.strptime(string, "%Y-%m-%d").date()
+
+
+def _today(args):
+    """Return the date that the reports are made as of"""
+    today = getattr(args, 'asof', None)
+    if today is None:
+        # Use the path via datetime now() so that we can use the
+        # existing mock in the test suite
+        today = datetime.datetime.now().date()
+    return today
+
+
+def forecast_window(args):
+    """Return the (start, end) window of dates that the repeating forecasts
+    are split into, or None to split them all
+    """
+    start = args.forecast_start
+    end = args.forecast_end
+
+    # The grid can limit them to just the months it will display
+    if getattr(args, 'forecast_window', False):
+        today = _today(args)
+        if start is None and args.display_days_prev is not None:
+            start = today - datetime.timedelta(days=args.display_days_prev)
+        if end is None and args.display_days_post is not None:
+            end = today + datetime.timedelta(days=args.display_days_post)
+
+    if start is None and end is None:
+        return None
+    return (start, end)
+
+
 def render_month(date):
     """Return a short string representation of the date as a month
     """
@@ -103,6 +152,83 @@ def grid_render_colheader(months, months_len, tags_len):
 #
 
 
+# The jinja2 Environments, keyed on their bytecode cache directory
+_jinja2_envs = {}
+
+
+def _jinja2_bytecode_cache(dirname):
+    """Return a jinja2 bytecode cache that keeps the compiled templates in
+    dirname, or None if that directory cannot be used
+    """
+    import jinja2
+
+    class BytecodeCache(jinja2.FileSystemBytecodeCache):
+        """Not being able to read or write the cache is not a reason to
+        fail the render, the template is just compiled again
+        """
+
+        def load_bytecode(self, bucket):
+            try:
+                super().load_bytecode(bucket)
+            except OSError:
+                pass
+
+        def dump_bytecode(self, bucket):
+            try:
+                super().dump_bytecode(bucket)
+            except OSError:
+                pass
+
+    try:
+        os.makedirs(dirname, exist_ok=True)
+    except OSError:
+        return None
+    return BytecodeCache(dirname)
+
+
+def jinja2_env(cache_dirname=None):
+    """Return the jinja2 Environment for our templates.
+
+    The same Environment is used for every render, so each template is
+    only compiled once per process (and checked for changes when used).
+    With a cache_dirname, the compiled templates are also kept on disk
+    there for the next run.
+    """
+    env = _jinja2_envs.get(cache_dirname)
+    if env is not None:
+        return env
+
+    import jinja2
+
+    bytecode_cache = None
+    if cache_dirname is not None:
+        bytecode_cache = _jinja2_bytecode_cache(cache_dirname)
+
+    templatedir = os.path.join(os.path.dirname(__file__), './templates/')
+
+    env = jinja2.Environment(
+            loader=jinja2.FileSystemLoader(templatedir),
+            extensions=[
+                'jinja2.ext.do',
+                'jinja2.ext.loopcontrols',
+            ],
+            bytecode_cache=bytecode_cache,
+    )
+    _jinja2_envs[cache_dirname] = env
+    return env
+
+
+def jinja2_cache_dirname(args):
+    """Return the directory to keep the compiled templates in, or None if
+    the cache is not enabled
+    """
+    if not getattr(args, 'cache_enable', False):
+        return None
+    if getattr(args, 'cache_dir', None):
+        return os.path.join(args.cache_dir, 'jinja2')
+    return cache_dir('jinja2')
+
+
 def subp_jinja2(args):
     def _hack_rentdue():
         last_payment = args.rows.group_by('hashtag')['bills:rent'].last()
@@ -131,22 +257,14 @@ def subp_jinja2(args):
         return date
 
     template = args.template
-    templatedir = os.path.join(os.path.dirname(__file__), './templates/')
-
-    env = jinja2.Environment(
-            loader=jinja2.FileSystemLoader(templatedir),
-            extensions=[
-                'jinja2.ext.do',
-                'jinja2.ext.loopcontrols',
-            ],
-    )
+    env = jinja2_env(jinja2_cache_dirname(args))
 
     # Load the template file
     tpl = env.get_template(template)
 
     variables = {
         # A convenience
-        'today': datetime.datetime.now().date(),
+        'today': _today(args),
 
         'args': args,
 
@@ -184,6 +302,7 @@ def subp_party(args):
 
 
 def subp_csv(args):
+    import csv
 
     # remove rows with no date (TODO: should csv output match input?)
     filtered = RowSet()
@@ -213,6 +332,7 @@ def subp_grid(args):
 
 
 def subp_json_payments(args):
+    import json
 
     payments = args.rows.filter(['direction==incoming']).group_by('hashtag')
 
@@ -330,9 +450,7 @@ def subp_statstsv(args):
         if isinstance(month, str):
             # its one of our rollup fake months
             if month == 'MonthTD':
-                # Use the path via datetime now() so that we can use the
-                # existing mock in the test suite
-                thismonth = datetime.datetime.now().date().replace(day=1)
+                thismonth = _today(args).replace(day=1)
                 s += thismonth.strftime('%s')
             else:
                 s += "# x"
@@ -516,6 +634,111 @@ def subp_report_location(args):
     return subp_jinja2(args)
 
 
+def subp_cache_clear(args):
+    """Remove all the cached parsed rows.  This does not need the data to
+    be loaded, so it is run without a ledger
+    """
+    count = RowCache(args.cache_dir).clear()
+    return "Removed {} cache entries".format(count)
+
+
+def subp_serve(args):
+    """Keep the loaded data in memory and run the subcommands asked for by
+    clients on the unix socket, only loading the changed files again
+    before each one
+    """
+    if args.socket is None:
+        raise ValueError('The serve subcommand needs a --socket to listen on')
+
+    server = make_server(args.socket, args.ledger, load_options(args))
+    with server:
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            os.unlink(args.socket)
+    return "Server stopped"
+
+
+def _target_argv(argparser, namespace, options):
+    """Return the commandline for one of the multi targets, with the global
+    options moved to before the subcommand
+    """
+    # The parser leaves any global options it finds after the subcommand
+    # unrecognised, which tells us which ones they are
+    _, extra = argparser.parse_known_args(
+        options,
+        namespace=argparse.Namespace(**vars(namespace))
+    )
+    rest = list(options)
+    for option in extra:
+        rest.remove(option)
+    return extra + rest
+
+
+def subp_multi(args):
+    """Run several subcommands, writing each result to its own file.
+
+    Each target is "outputfile=subcommand [options]", where the options
+    are the commandline options for that subcommand, split up like a shell
+    would (eg: "grid.txt=grid --includefuture --display_days_prev=270").
+    The outputfile cannot contain an "=".  The loaded data is shared, so
+    each of the split, nosplit and includefuture variants is only built
+    once.
+    """
+    import shlex
+
+    argparser = build_argparser()
+
+    # Check all the targets before running any of them
+    jobs = []
+    for target in args.targets:
+        outputfile, sep, spec = target.partition('=')
+        options = shlex.split(spec)
+        if not sep or not outputfile or not options:
+            raise ValueError(
+                'Target "{}" is not outputfile=subcommand'.format(target)
+            )
+
+        cmd = options[0]
+        if cmd not in subp_cmds:
+            raise ValueError(
+                'Target "{}" has an unknown subcommand "{}"'.format(target,
+                                                                    cmd)
+            )
+        if cmd in ('multi', 'serve', 'cache_clear'):
+            raise ValueError('Target "{}" cannot be used here'.format(target))
+
+        # Each target starts with the options given to this command
+        namespace = argparse.Namespace(**vars(args))
+        del namespace.targets
+        target_args = argparser.parse_args(
+            _target_argv(argparser, namespace, options),
+            namespace=namespace
+        )
+        jobs.append((target, target_args, outputfile))
+
+    written = []
+    failed = []
+    for target, target_args, outputfile in jobs:
+        try:
+            result = run(target_args, args.ledger)
+        except Exception:
+            # Carry on with the others, but do not hide the problem
+            traceback.print_exc()
+            failed.append(target)
+            continue
+
+        with open(outputfile, 'w') as f:
+            print(result, file=f)
+        written.append(outputfile)
+
+    if failed:
+        raise RuntimeError('Failed targets: {}'.format(' '.join(failed)))
+    return "Wrote {}".format(' '.join(written))
+
+
 # A list of all the sub-commands
 subp_cmds = {
     'jinja2': {
@@ -574,14 +797,29 @@ subp_cmds = {
         'func': subp_report_location,
         'help': 'Show where the cash is, using the location metadata',
     },
+    'cache_clear': {
+        'func': subp_cache_clear,
+        'help': 'Remove all the cached parsed rows',
+    },
+    'multi': {
+        'func': subp_multi,
+        'help': 'Run several subcommands, writing each result to a file',
+    },
+    'serve': {
+        'func': subp_serve,
+        'help': 'Keep the data loaded and run subcommands for --socket clients',
+    },
 }
 
+
 #
 # Most of this is boilerplate and stays the same even with addition of
 # features.  The only exception is if a sub-command needs to add a new
 # commandline option.
 #
-if __name__ == '__main__':  # pragma: no cover
+def build_argparser():
+    """Return the parser for all of the commandline options
+    """
     argparser = argparse.ArgumentParser(
         description='Run calculations and transformations on cash data')
     argparser.add_argument('-v', '--verbose', action='count', default=0)
@@ -595,7 +833,7 @@ if __name__ == '__main__':  # pragma: no cover
                            action='store_true',
                            help='Include predicted future transactions from '
                            'a separate input directory')
-    argparser.add_argument('--filter', action='append',
+    argparser.add_argument('--filter', action='append', type=Filter,
                            help='Add a key=value filter to the rows used')
     argparser.add_argument('--split', dest='split',
                            action='store_true',
@@ -604,6 +842,72 @@ if __name__ == '__main__':  # pragma: no cover
                            action='store_false',
                            help='Do not split rows that cover multiple months')
     argparser.set_defaults(split=True)
+    argparser.add_argument('--asof', type=_parse_date,
+                           help='Make the reports as of this YYYY-MM-DD '
+                           'date instead of today')
+    argparser.add_argument('--forecast_start', type=_parse_date,
+                           help='When splitting, only create repeating '
+                           'forecast rows from this YYYY-MM-DD date')
+    argparser.add_argument('--forecast_end', type=_parse_date,
+                           help='When splitting, only create repeating '
+                           'forecast rows up to this YYYY-MM-DD date')
+    argparser.add_argument('--jobs', type=int, default=1,
+                           help='Parse the input files using this many '
+                           'processes (0 for one per cpu)')
+    argparser.add_argument('--cache', dest='cache_enable',
+                           action='store_true',
+                           help='Use the cache of parsed input files')
+    argparser.add_argument('--nocache', dest='cache_enable',
+                           action='store_false',
+                           help='Do not use the cache of parsed input files')
+    argparser.set_defaults(cache_enable=True)
+    argparser.add_argument('--columnar',
+                           action='store_true',
+                           help='Store the rows in columns and use numpy '
+                           'for the filters, group_by and their totals')
+    argparser.add_argument('--check_value',
+                           action='store_true',
+                           help='Re-sum the rows to check every RowSet total'
+                           ' (slow, for debugging)')
+    argparser.add_argument('--index',
+                           action='store_true',
+                           help='Index the rows by the commonly used fields'
+                           ' (with -v, report the index use)')
+    argparser.add_argument('--cache_dir',
+                           action='store',
+                           type=str,
+                           help='Directory to store the cache in')
+
+    argparser.add_argument('--profile',
+                           action='store_true',
+                           help='Report the time and memory peak of each'
+                           ' stage to stderr')
+    argparser.add_argument('--profile_format',
+                           choices=('table', 'json'),
+                           default='table',
+                           help='With --profile, report as a table or as'
+                           ' JSON')
+    argparser.add_argument('--profile_dump',
+                           action='store',
+                           type=str,
+                           help='With --profile, also save a cProfile of each'
+                           ' stage into this directory')
+    argparser.add_argument('--stats_json', '--stats-json',
+                           action='store',
+                           type=str,
+                           metavar='FILE',
+                           help='Save the counts of the work done on the rows'
+                           ' as JSON into this file (or stderr, for "-")')
+    argparser.add_argument('--importtime',
+                           action='store_true',
+                           help='Run with "python -X importtime" and report'
+                           ' the slowest imports to stderr')
+    argparser.add_argument('--socket',
+                           action='store',
+                           type=str,
+                           help='Ask the server listening on this unix socket'
+                           ' to run the subcommand (or, for "serve", the'
+                           ' socket to listen on)')
 
     subp = argparser.add_subparsers(help='Subcommand', dest='cmd')
     subp.required = True
@@ -627,6 +931,19 @@ if __name__ == '__main__':  # pragma: no cover
     )                                                                   # noqa
     subp_cmds['grid']['parser'].set_defaults(display_days_post=182)
 
+    subp_cmds['grid']['parser'].add_argument('--forecast_window',       # noqa
+        action='store_true',                                            # noqa
+        help='Only create the repeating forecast rows for the displayed months'  # noqa
+        ' (the running balance then only includes those forecasts)'     # noqa
+    )                                                                   # noqa
+
+    subp_cmds['multi']['parser'].add_argument('targets',
+                                              # F.U. E128
+                                              nargs='+',
+                                              metavar='outputfile=subcommand [options]',  # noqa
+                                              help='What to run and where to write the result'  # noqa
+    ) # noqa F.U. E124
+
     subp_cmds['jinja2']['parser'].add_argument('template',
                                                # F.U. E128
                                                action='store',
@@ -652,29 +969,301 @@ if __name__ == '__main__':  # pragma: no cover
     #
     # Now get off my lawn
 
-    args = argparser.parse_args()
+    return argparser
+
 
+def make_ledger(args):
+    """Return a Ledger that loads the data as the options ask for
+    """
     if not os.path.exists(args.dir):
         raise RuntimeError('Directory "{}" does not exist'.format(args.dir))
 
-    # first, load the main data
-    args.rows = RowSet()
-    args.rows.load_directory(args.dir)
+    if args.cache_enable:
+        cache = RowCache(args.cache_dir)
+    else:
+        cache = None
+
+    if args.columnar:
+        from columnar import ColumnarRowSet
+        rowset_class = ColumnarRowSet
+    else:
+        rowset_class = RowSet
+
+    return Ledger(args.dir, rowset_class, index=args.index, jobs=args.jobs,
+                  cache=cache)
 
-    # next, optionally load additional directories
-    # TODO - make these loaders into a generic list of directories
-    if args.includefuture:
-        args.rows.load_directory(
-            os.path.join(args.dir, "future"),
-            skip_balance_check=True
+
+def run(args, ledger):
+    """Run the chosen subcommand on the rows from the ledger and return its
+    output
+    """
+    # All the dates relative to "now" use the same date for the whole run,
+    # and whatever was set before is put back once the run is finished
+    if args.asof is None:
+        args.asof = datetime.datetime.now().date()
+    previous_asof = set_asof(args.asof)
+
+    try:
+        args.ledger = ledger
+
+        # optionally split multi-month transactions into one per month, and
+        # apply any filters requested.  The split rows are filtered as they
+        # are made, so the unwanted ones are never kept
+        args.rows = ledger.rows(
+            args.includefuture,
+            args.split,
+            forecast_window(args),
+            args.filter
         )
 
-    # optionally split multi-month transactions into one per month
-    if args.split:
-        args.rows = args.rows.autosplit()
+        with timing.stage(args.cmd):
+            return args.func(args)
+    finally:
+        set_asof(previous_asof)
+
+
+# The options that change how the data is loaded.  A server has already
+# loaded the data, so its clients cannot change these
+LOAD_OPTIONS = ('dir', 'cache_enable', 'cache_dir', 'columnar', 'index',
+                'jobs')
+
+
+def load_options(args, cwd=None):
+    """Return the options that the data is loaded with, with any paths made
+    absolute (relative to cwd, if given)
+    """
+    options = {}
+    for name in LOAD_OPTIONS:
+        value = getattr(args, name)
+        if name in ('dir', 'cache_dir') and value is not None:
+            value = os.path.normpath(os.path.join(cwd or os.getcwd(), value))
+        options[name] = value
+    return options
+
+
+def serve_one(argparser, ledger, argv, options=None, cwd=None):
+    """Answer one request from a client, returning the reply to send.
+
+    If the options the ledger was loaded with are given, the client must
+    ask for the same ones.  Any relative paths the client gives are from
+    its cwd
+    """
+    try:
+        args = argparser.parse_args(argv)
+        if args.cmd == 'serve':
+            raise ValueError('The server is already running')
+        if args.cmd == 'cache_clear':
+            raise ValueError('Run cache_clear without the --socket')
+        if args.cmd == 'multi':
+            # The files would be written by the server, not the client
+            raise ValueError('Run multi without the --socket')
+
+        if options is not None:
+            wanted = load_options(args, cwd)
+            different = [x for x in LOAD_OPTIONS if wanted[x] != options[x]]
+            if different:
+                raise ValueError(
+                    'The server loaded the data with different {}'.format(
+                        ', '.join(different)
+                    )
+                )
+
+        # Only the files that have changed are loaded again
+        ledger.refresh()
+        return {'result': run(args, ledger)}
+    except SystemExit:
+        # argparse has already told our stderr about the problem
+        return {'error': 'Bad commandline: {}'.format(' '.join(argv))}
+    except Exception as e:
+        return {'error': '{}: {}'.format(type(e).__name__, e)}
+
+
+def make_server(path, ledger, options=None):
+    """Return a server listening on the unix socket path.  The load_options()
+    that the ledger was loaded with are checked against each request
+    """
+    import json
+    import socket
+    import socketserver
+
+    class Handler(socketserver.StreamRequestHandler):
+        """Each request is a single line of JSON with the commandline to
+        run and the cwd of the client, and the reply is a single line of
+        JSON with the result or the error
+        """
+
+        def handle(self):
+            line = self.rfile.readline()
+            if not line:
+                # Just checking that we are here
+                return
+
+            request = json.loads(line.decode('utf8'))
+            reply = serve_one(server.argparser, server.ledger,
+                              request['argv'], server.options,
+                              request['cwd'])
+            self.wfile.write(json.dumps(reply).encode('utf8') + b'\n')
+
+    if os.path.exists(path):
+        try:
+            with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+                sock.connect(path)
+        except OSError:
+            # Left over from an earlier server
+            os.unlink(path)
+        else:
+            raise RuntimeError(
+                'A server is already listening on "{}"'.format(path)
+            )
+
+    server = socketserver.UnixStreamServer(path, Handler)
+    server.argparser = build_argparser()
+    server.ledger = ledger
+    server.options = options
+    return server
+
 
-    # apply any filters requested
-    args.rows = args.rows.filter(args.filter)
+def client(path, argv):
+    """Ask the server on the unix socket path to run the commandline and
+    return its reply
+    """
+    import json
+    import socket
+
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+        sock.connect(path)
+        with sock.makefile('rwb') as stream:
+            request = {'argv': argv, 'cwd': os.getcwd()}
+            stream.write(json.dumps(request).encode('utf8') + b'\n')
+            stream.flush()
+            return json.loads(stream.readline().decode('utf8'))
+
+
+def importtime_report(lines, count=15):
+    """Given the stderr lines from "python -X importtime", return a report
+    of the total import time and the modules that took the longest
+    """
+    modules = []
+    total = 0
+    for line in lines:
+        fields = line.split('|')
+        if len(fields) != 3 or not line.startswith('import time:'):
+            continue
+        try:
+            self_us = int(fields[0].split(':')[1])
+            cumulative_us = int(fields[1])
+        except ValueError:
+            # The heading line
+            continue
+        name = fields[2].rstrip()
+        if not name.startswith('  '):
+            # A top level import, whose time includes all of its imports
+            total += cumulative_us
+        modules.append((self_us, cumulative_us, name.strip()))
+
+    modules.sort(reverse=True)
+
+    result = ["Total import time: {:.1f} ms".format(total / 1000)]
+    result.append("{:>10} {:>10}  {}".format('self ms', 'total ms', 'module'))
+    for self_us, cumulative_us, name in modules[:count]:
+        result.append("{:>10.1f} {:>10.1f}  {}".format(
+            self_us / 1000,
+            cumulative_us / 1000,
+            name
+        ))
+    return "\n".join(result)
+
+
+def work_stats():
+    """Return all the counts of the work done on the rows so far
+    """
+    return {
+        'row': row_stats,
+        'rowset': rowset_stats,
+        'index': index_stats,
+        'group_by': group_by_stats,
+        'tagschema': tagschema_stats,
+    }
+
+
+def write_stats_json(filename):
+    """Save the work_stats() as JSON into the file, or to stderr for "-"
+    """
+    import json
+
+    text = json.dumps(work_stats(), indent=2, sort_keys=True)
+    if filename == '-':
+        print(text, file=sys.stderr)
+        return
+    with open(filename, 'w') as f:
+        f.write(text + '\n')
+
+
+def run_importtime(argv):
+    """Run this command again with the import times recorded, then report
+    on them.  Returns the exit status of the command
+    """
+    import subprocess
+
+    argv = [x for x in argv if x != '--importtime']
+    proc = subprocess.run(
+        [sys.executable, '-X', 'importtime', os.path.abspath(__file__)] + argv,
+        stderr=subprocess.PIPE,
+        universal_newlines=True,
+    )
+
+    lines = proc.stderr.splitlines()
+    for line in lines:
+        # Pass on anything else the command said
+        if not line.startswith('import time:'):
+            print(line, file=sys.stderr)
+
+    print(importtime_report(lines), file=sys.stderr)
+    return proc.returncode
+
+
+if __name__ == '__main__':  # pragma: no cover
+    argparser = build_argparser()
+    args = argparser.parse_args()
 
-    result = args.func(args)
+    if args.importtime:
+        sys.exit(run_importtime(sys.argv[1:]))
+
+    if args.cmd == 'cache_clear':
+        # Only the cache is needed, never the data (which might be what is
+        # broken) or any server
+        print(subp_cache_clear(args))
+        sys.exit(0)
+
+    if args.socket is not None and args.cmd != 'serve':
+        # The commandline is checked here, but run by the server
+        reply = client(args.socket, sys.argv[1:])
+        if 'error' in reply:
+            print(reply['error'], file=sys.stderr)
+            sys.exit(1)
+        print(reply['result'])
+        sys.exit(0)
+
+    if args.check_value:
+        RowSet.check_value = True
+
+    if args.profile:
+        timing.start(args.profile_dump)
+
+    ledger = make_ledger(args)
+    result = run(args, ledger)
     print(result)
+
+    if args.profile:
+        timer = timing.stop()
+        if args.profile_format == 'json':
+            import json
+            print(json.dumps(timer.as_list(), indent=2), file=sys.stderr)
+        else:
+            print(timer.table(), file=sys.stderr)
+
+    if args.stats_json:
+        write_stats_json(args.stats_json)
+
+    if args.index and args.verbose:
+        print("Index use: {}".format(index_stats), file=sys.stderr)
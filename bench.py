@@ -0,0 +1,425 @@
+#!/usr/bin/env python3
+# Licensed under GPLv3
+"""Time some of the operations on the cash data, to allow comparing the
+performance before and after a change to the code.
+
+An example use:
+
+./bench.py >before.txt
+## make a lot of changes
+./bench.py >after.txt
+
+As the real data is quite small, a larger synthetic set of data can be
+generated and a full suite of benchmarks run on several sizes of it:
+
+./bench.py generate --years 10 --members 100 /tmp/cash
+./bench.py suite --scales 1x10,5x50,10x100 --output before.json
+"""
+import argparse
+import datetime
+import decimal
+import glob
+import platform
+import subprocess
+import tempfile
+import random
+import json
+import time
+import sys
+import os
+
+# Ensure that we look for any modules in our local lib dir.  This allows simple
+# testing and development use.  It also does not break the case where the lib
+# has been installed properly on the normal sys.path
+sys.path.insert(0,
+                os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                             'lib'))
+# I would use site.addsitedir, but it does an append, not insert
+
+from row import Row # noqa
+from row import set_asof # noqa
+from rowset import RowSet # noqa
+
+FILES_DIR = 'cash'
+
+
+def timeit(fn, repeat):
+    """Call the fn repeatedly and return the fastest time taken, in seconds
+    """
+    best = None
+    for i in range(repeat):
+        start = time.perf_counter()
+        fn()
+        elapsed = time.perf_counter() - start
+        if best is None or elapsed < best:
+            best = elapsed
+    return best
+
+
+def bench_load(args):
+    def fn():
+        rows = RowSet()
+        rows.load_directory(args.dir)
+        rows.load_directory(
+            os.path.join(args.dir, "future"),
+            skip_balance_check=True
+        )
+    return timeit(fn, args.repeat)
+
+
+def bench_startup(args):
+    """The time from starting "balance.py sum" to its first output, which
+    is mostly the python startup and the imports
+    """
+    command = [
+        sys.executable,
+        os.path.join(os.path.dirname(os.path.abspath(__file__)), 'balance.py'),
+        '--dir', args.dir,
+        'sum',
+    ]
+
+    best = None
+    for i in range(args.repeat):
+        start = time.perf_counter()
+        with subprocess.Popen(command, stdout=subprocess.PIPE) as proc:
+            proc.stdout.read(1)
+            elapsed = time.perf_counter() - start
+            proc.stdout.read()
+        if best is None or elapsed < best:
+            best = elapsed
+    return best
+
+
+# Where the synthetic money is kept, and how the members pay
+_LOCATIONS = ('nic', 'nic', 'nic', 'nic', 'philip', 'hamish', 'gary')
+_PAYPAL_FEE = decimal.Decimal('-29.65')
+_PAYPAL_ID = '0123456789ABCDEFGHJKLMNPRSTUVWXY'
+
+
+def _money(value):
+    return str(decimal.Decimal(value).quantize(decimal.Decimal('0.01')))
+
+
+class _Month(object):
+    """The lines for one synthetic month file, keeping the balance"""
+
+    def __init__(self, year, month, balance):
+        self.year = year
+        self.month = month
+        self.balance = balance
+        self.lines = ['#balance {} opening balance'.format(_money(balance))]
+
+    def date(self, day):
+        return datetime.date(self.year, self.month, day).isoformat()
+
+    def add(self, value, day, comment):
+        value = decimal.Decimal(value)
+        self.balance += value
+        self.lines.append('{:<7} {} {}'.format(value, self.date(day),
+                                               comment))
+
+
+def generate(dirname, years=2, members=20, seed=1, start_year=2016):
+    """Write a synthetic set of cash files into the dirname, with a valid
+    balance chain, for the given number of years and members.  Returns the
+    date of the last day of the data
+    """
+    rng = random.Random(seed)
+    futuredir = os.path.join(dirname, 'future')
+    os.makedirs(futuredir, exist_ok=True)
+
+    names = ['member{}'.format(i) for i in range(members)]
+    paypal = set(rng.sample(names, members // 3))
+    dues = {name: rng.choice((500, 700, 700, 1000)) for name in names}
+    skip = {name: 0 for name in names}
+
+    rent = -(members * 300 + 200)
+
+    balance = decimal.Decimal(0)
+    for year in range(start_year, start_year + years):
+        for month in range(1, 13):
+            m = _Month(year, month, balance)
+            if balance == 0:
+                # Enough to keep the balance above zero
+                m.add(years * 12 * 1000, 1,
+                      '#donation Starting funds !locn:nic')
+
+            paypal_total = 0
+            for name in names:
+                if skip[name]:
+                    # Paid in advance
+                    skip[name] -= 1
+                    continue
+                if rng.random() < 0.1:
+                    # Not paid this month
+                    continue
+
+                value = dues[name]
+                tags = '#dues:{}'.format(name)
+                chance = rng.random()
+                if chance < 0.1:
+                    # Paying for next month too, split into two rows
+                    value *= 2
+                    tags += ' !months:2'
+                    skip[name] = 1
+                elif chance < 0.15:
+                    value *= 3
+                    tags += ' !months:3'
+                    skip[name] = 2
+
+                day = rng.randint(1, 28)
+                if name in paypal:
+                    txn = ''.join(rng.choice(_PAYPAL_ID) for i in range(17))
+                    m.add(value, day,
+                          '{} !locn:paypal !id:paypal:{}'.format(tags, txn))
+                    m.add(_PAYPAL_FEE, day, '{} !locn:paypal'.format(tags))
+                    paypal_total += value + _PAYPAL_FEE
+                else:
+                    locn = rng.choice(_LOCATIONS)
+                    m.add(value, day, '{} !locn:{}'.format(tags, locn))
+
+            # Move the paypal money to the bank
+            if paypal_total:
+                m.add(0, 28, '!locn_xfer:paypal:nic:{}'.format(
+                    _money(paypal_total)))
+
+            m.add(rent, 1, '#bills:rent !locn:nic')
+            m.add(-rng.randint(150, 400), 7,
+                  '#bills:electricity !locn:philip !months:-1:1')
+            m.add(-268, 17, '#bills:internet !locn:philip')
+            m.add(-40, 22, '#bills:hosting !locn:hamish !months:1:1'
+                  ' !id:cac:{}'.format(rng.randint(10000000, 99999999)))
+
+            for i in range(rng.randint(1, 6)):
+                m.add(rng.randint(5, 300), rng.randint(1, 28),
+                      '#fridge !locn:{}'.format(rng.choice(_LOCATIONS)))
+            if rng.random() < 0.3:
+                m.add(rng.randint(50, 500), rng.randint(1, 28),
+                      '#donation !locn:nic')
+
+            filename = os.path.join(dirname, '{:04}-{:02}.txt'.format(
+                year, month))
+            with open(filename, 'w') as f:
+                f.write("\n".join(m.lines) + "\n")
+            balance = m.balance
+
+    # The expected future income and bills
+    start = datetime.date(start_year + years, 1, 1).isoformat()
+    for name in names:
+        filename = os.path.join(futuredir, 'dues,{}.txt'.format(name))
+        with open(filename, 'w') as f:
+            f.write('{} {} #dues:{} !forecast:monthly !locn:paypal\n'.format(
+                dues[name], start, name))
+    with open(os.path.join(futuredir, 'bills,rent.txt'), 'w') as f:
+        f.write('{} {} #bills:rent !forecast:monthly\n'.format(rent, start))
+
+    return datetime.date(start_year + years - 1, 12, 31)
+
+
+benchmarks = {
+    'load': bench_load,
+    'startup': bench_startup,
+}
+
+
+# The subcommands that make a report from the rows
+SUITE_SUBCOMMANDS = (
+    'sum', 'party', 'csv', 'roundtrip', 'json_payments', 'topay',
+    'topay_html', 'grid', 'make_balance', 'stats', 'statstsv',
+    'check_doubletxn', 'report_location',
+)
+
+
+def suite_one(dirname, asof, repeat):
+    """Time each of the operations on the data in the dirname, returning a
+    dict of the fastest times, in seconds
+    """
+    # The relative dates are only changed while the suite is running
+    previous_asof = set_asof(asof)
+    try:
+        return _suite_one(dirname, asof, repeat)
+    finally:
+        set_asof(previous_asof)
+
+
+def _suite_one(dirname, asof, repeat):
+    import balance
+
+    futuredir = os.path.join(dirname, 'future')
+    results = {}
+
+    lines = []
+    for filename in sorted(glob.glob(os.path.join(dirname, '*.txt'))):
+        with open(filename) as f:
+            lines.extend(f.read().splitlines())
+
+    def parse():
+        for line in lines:
+            Row.fromTxt(line)
+    results['Row.fromTxt'] = timeit(parse, repeat)
+
+    def load():
+        rows = RowSet()
+        rows.load_directory(dirname)
+        rows.load_directory(futuredir, skip_balance_check=True)
+        return rows
+    results['load_directory'] = timeit(load, repeat)
+
+    rows = load()
+    results['autosplit'] = timeit(rows.autosplit, repeat)
+
+    rows = rows.autosplit()
+    results['filter'] = timeit(
+        lambda: rows.filter(['isdata==1', 'hashtag=~^dues:']),
+        repeat
+    )
+
+    # Time the grouping itself, not the memo of the results
+    memo_size = RowSet.group_by_memo_size
+    RowSet.group_by_memo_size = 0
+    try:
+        for field in ('month', 'hashtag'):
+            results['group_by:' + field] = timeit(
+                lambda: rows.group_by(field),
+                repeat
+            )
+    finally:
+        RowSet.group_by_memo_size = memo_size
+
+    results['filter_forecast'] = timeit(rows.filter_forecast, repeat)
+    results['grid_by'] = timeit(lambda: rows.grid_by('month', 'hashtag'),
+                                repeat)
+
+    # The subcommands share the loaded and split data, as they would in a
+    # multi run, so this is just the time to make each report
+    argparser = balance.build_argparser()
+    ledger = balance.Ledger(dirname)
+    ledger.rows()
+    for cmd in SUITE_SUBCOMMANDS:
+        argv = ['--dir', dirname, '--asof', asof.isoformat(), cmd]
+
+        def fn():
+            balance.run(argparser.parse_args(argv), ledger)
+
+        try:
+            results['subcommand:' + cmd] = timeit(fn, repeat)
+        except Exception as e:
+            print("{}: {}".format(cmd, e), file=sys.stderr)
+            results['subcommand:' + cmd] = None
+
+    return results
+
+
+def _parse_scales(string):
+    """Used as an argparse type to read a list of YEARSxMEMBERS sizes"""
+    scales = []
+    for scale in string.split(','):
+        years, members = scale.split('x')
+        scales.append((int(years), int(members)))
+    return scales
+
+
+def suite(scales, repeat):
+    """Run the benchmarks on generated data of each of the scales, returning
+    the results in a form that can be saved as JSON
+    """
+    result = {
+        'python': platform.python_version(),
+        'repeat': repeat,
+        'scales': [],
+    }
+
+    for years, members in scales:
+        with tempfile.TemporaryDirectory() as dirname:
+            asof = generate(dirname, years=years, members=members)
+
+            rows = RowSet()
+            rows.load_directory(dirname)
+
+            result['scales'].append({
+                'years': years,
+                'members': members,
+                'files': len(glob.glob(os.path.join(dirname, '*.txt'))),
+                'rows': len(rows),
+                'seconds': suite_one(dirname, asof, repeat),
+            })
+
+    return result
+
+
+def suite_table(result):
+    """Return the suite results as a human readable table, in milliseconds
+    """
+    scales = result['scales']
+    names = list(scales[0]['seconds'].keys()) if scales else []
+
+    header = ["{:<28}".format('rows')]
+    for scale in scales:
+        header.append("{:>12}".format(scale['rows']))
+    lines = [''.join(header)]
+
+    for name in names:
+        line = ["{:<28}".format(name)]
+        for scale in scales:
+            seconds = scale['seconds'][name]
+            if seconds is None:
+                line.append("{:>12}".format('error'))
+            else:
+                line.append("{:>12.2f}".format(seconds * 1000))
+        lines.append(''.join(line))
+    return "\n".join(lines)
+
+
+if __name__ == '__main__':  # pragma: no cover
+    argparser = argparse.ArgumentParser(
+        description='Time operations on the cash data')
+    argparser.add_argument('--dir',
+                           action='store',
+                           type=str,
+                           default=os.path.join(os.path.join(
+                               os.path.dirname(__file__), FILES_DIR)),
+                           help='Input directory')
+    argparser.add_argument('--repeat',
+                           action='store',
+                           type=int,
+                           default=10,
+                           help='How many times to repeat each benchmark')
+
+    subp = argparser.add_subparsers(help='Subcommand', dest='cmd')
+
+    generate_parser = subp.add_parser(
+        'generate',
+        help='Write a synthetic set of cash files into a directory')
+    generate_parser.add_argument('output', help='The directory to write to')
+    generate_parser.add_argument('--years', type=int, default=2)
+    generate_parser.add_argument('--members', type=int, default=20)
+    generate_parser.add_argument('--seed', type=int, default=1)
+    generate_parser.add_argument('--start_year', type=int, default=2016)
+
+    suite_parser = subp.add_parser(
+        'suite',
+        help='Run all the benchmarks on synthetic data of several sizes')
+    suite_parser.add_argument('--scales',
+                              type=_parse_scales,
+                              default=_parse_scales('1x10,5x50,10x100'),
+                              help='Comma separated YEARSxMEMBERS sizes')
+    suite_parser.add_argument('--output',
+                              help='Also save the results to this JSON file')
+
+    args = argparser.parse_args()
+
+    if args.cmd == 'generate':
+        last = generate(args.output, args.years, args.members, args.seed,
+                        args.start_year)
+        print("Generated data up to {}".format(last))
+
+    elif args.cmd == 'suite':
+        result = suite(args.scales, args.repeat)
+        print(suite_table(result))
+        if args.output:
+            with open(args.output, 'w') as f:
+                json.dump(result, f, indent=2)
+
+    else:
+        for name, fn in benchmarks.items():
+            print("{:<20} {:>10.2f} ms".format(name, fn(args) * 1000))
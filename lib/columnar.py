@@ -0,0 +1,316 @@
+# Licensed under GPLv3
+import datetime
+import decimal
+
+try:
+    import numpy
+except ImportError:  # pragma: no cover
+    numpy = None
+
+from row import simple_value
+from row import row_stats
+from row import Filter
+from rowset import RowSet
+from rowset import rowset_stats
+
+
+# Used to mark rows that do not have the requested field at all
+_MISSING = object()
+
+
+class Column(object):
+    """One field from every row, stored as an array of integer codes that
+    index into a list of the distinct values (in order of first appearance)
+    """
+
+    def __init__(self, values):
+        index = {}
+        categories = []
+        codes = numpy.empty(len(values), dtype=numpy.int32)
+        for i, value in enumerate(values):
+            # Keep values that compare equal but have different string
+            # forms (eg: 1, True and Decimal('1.0')) as separate values
+            if isinstance(value, decimal.Decimal):
+                key = (type(value), str(value))
+            else:
+                key = (type(value), value)
+            code = index.get(key)
+            if code is None:
+                code = len(categories)
+                index[key] = code
+                categories.append(value)
+            codes[i] = code
+
+        self.codes = codes
+        self.categories = categories
+
+    def take(self, indices):
+        """Return a new column with only the given rows in it
+        """
+        new = Column.__new__(Column)
+        new.codes = self.codes[indices]
+        new.categories = self.categories
+        return new
+
+    def mask(self, fn, where=None):
+        """Return a boolean array of the rows where fn(value) is true,
+        calling fn only once for each distinct value.
+
+        If a where mask is given, only the rows selected by it are looked at
+        (and all others are false)
+        """
+        codes = self.codes
+        if where is not None:
+            codes = codes[where]
+
+        verdicts = numpy.zeros(len(self.categories), dtype=bool)
+        for code in numpy.unique(codes):
+            verdicts[code] = fn(self.categories[code])
+
+        if where is None:
+            return verdicts[codes]
+
+        result = numpy.zeros(len(self.codes), dtype=bool)
+        result[where] = verdicts[codes]
+        return result
+
+
+class Numbers(object):
+    """The value (as whole cents and the number of decimal places it was
+    written with), date ordinal and forecast flag of every row, stored as
+    numpy arrays so that the totals of any selection of the rows can be
+    found without looking at the rows
+    """
+
+    def __init__(self, cents, places, ordinals, forecast):
+        self.cents = cents
+        self.places = places
+        # Rows without a date have the ordinal zero
+        self.ordinals = ordinals
+        self.forecast = forecast
+
+    @classmethod
+    def from_rows(cls, rows):
+        """Return the Numbers for the rows, or None if any of the values
+        are not whole numbers of cents
+        """
+        count = len(rows)
+        cents = numpy.empty(count, dtype=numpy.int64)
+        places = numpy.empty(count, dtype=numpy.int8)
+        ordinals = numpy.zeros(count, dtype=numpy.int64)
+        forecast = numpy.empty(count, dtype=bool)
+
+        for i, row in enumerate(rows):
+            value = decimal.Decimal(row.value)
+            if not value.is_finite():
+                return None
+            exponent = value.as_tuple().exponent
+            if exponent < -2:
+                return None
+            cents[i] = int(value.scaleb(2))
+            places[i] = max(0, -exponent)
+
+            date = getattr(row, 'date', None)
+            if date is not None:
+                ordinals[i] = date.toordinal()
+            forecast[i] = row.isforecast
+
+        return cls(cents, places, ordinals, forecast)
+
+    def take(self, indices):
+        """Return the Numbers of only the given rows
+        """
+        return Numbers(
+            self.cents[indices],
+            self.places[indices],
+            self.ordinals[indices],
+            self.forecast[indices],
+        )
+
+    def balance(self):
+        """Return the total value, as the same Decimal that adding up the
+        row values would give
+        """
+        if not len(self.cents):
+            return decimal.Decimal(0)
+
+        # A Decimal sum has as many places as the most precise value in it
+        places = int(self.places.max())
+        total = int(self.cents.sum()) // 10 ** (2 - places)
+        return decimal.Decimal(total).scaleb(-places)
+
+    def first_date(self):
+        """Return the first date, or None if there are no dated rows
+        """
+        dated = self.ordinals[self.ordinals != 0]
+        if not len(dated):
+            return None
+        return datetime.date.fromordinal(int(dated.min()))
+
+    def last(self):
+        """Return the position of the first row with the last date, or None
+        if there are no dated rows
+        """
+        if not self.ordinals.any():
+            return None
+        # the undated rows have the lowest ordinal, and argmax finds the
+        # first of the highest
+        return int(self.ordinals.argmax())
+
+
+class ColumnarRowSet(RowSet):
+    """A RowSet that additionally stores its rows as columns, allowing the
+    filter and group_by operations to be done as numpy vector operations.
+
+    The columns are built on first use of each field and are carried
+    into the results of the filter and group_by, so a chain of these
+    operations only needs to look at each row once.  The values, dates and
+    forecast flags are kept as numpy arrays too, so the totals of each
+    result are found from the arrays instead of adding up the rows.  The
+    rows themselves are still kept in a list, which each result copies
+    the selected rows from.
+    """
+
+    def __init__(self):
+        if numpy is None:
+            raise RuntimeError('The columnar RowSet needs numpy installed')
+
+        super().__init__()
+        self._columns = {}
+        # The Numbers for all the rows, False when they have not been
+        # built yet and None if they cannot be
+        self._numbers = False
+
+    @classmethod
+    def from_rowset(cls, rowset):
+        """Return a new ColumnarRowSet containing the rows from rowset
+        """
+        result = cls()
+        result.append(list(rowset))
+        return result
+
+    def _add_one_value(self, item):
+        super()._add_one_value(item)
+
+        # any columns are now out of date
+        if self._columns:
+            self._columns = {}
+        self._numbers = False
+
+    def _truncate(self, length, state):
+        super()._truncate(length, state)
+        self._columns = {}
+        self._numbers = False
+
+    def _column(self, field):
+        column = self._columns.get(field)
+        if column is None:
+            column = Column(
+                [getattr(row, field, _MISSING) for row in self.rows]
+            )
+            self._columns[field] = column
+        return column
+
+    def _take(self, indices):
+        """Return a new ColumnarRowSet with the rows at the given indices,
+        reusing the slices of any columns we have already built
+        """
+        if self._numbers is False:
+            self._numbers = Numbers.from_rows(self.rows)
+
+        result = self._new()
+        rows = self.rows
+        selected = [rows[i] for i in indices.tolist()]
+
+        if self._numbers is None:
+            # Some values cannot be summed as cents, so add them one by one
+            result.append(selected)
+        else:
+            numbers = self._numbers.take(indices)
+            result.rows = selected
+            result.balance = numbers.balance()
+            result.isforecast = bool(numbers.forecast.any())
+            result.first_date = numbers.first_date()
+            last = numbers.last()
+            if last is not None:
+                result._last_row = selected[last]
+                result.last_date = result._last_row.date
+            result._numbers = numbers
+
+        for field, column in self._columns.items():
+            result._columns[field] = column.take(indices)
+
+        return result
+
+    def filter(self, filter_strings):
+        """Apply the given list of human readable filters to the rows
+        """
+        if filter_strings is None:
+            filter_strings = []
+
+        mask = numpy.ones(len(self.rows), dtype=bool)
+        for f in filter_strings:
+            f = Filter.compile(f)
+
+            try:
+                column = self._column(f.field)
+            except TypeError:
+                # the field values cannot be used as a dict key
+                return super().filter(filter_strings)
+
+            if _MISSING in column.categories:
+                # let the row by row code produce the error
+                return super().filter(filter_strings)
+
+            def fn(value):
+                row_stats['filter_evaluations'] += 1
+                return f.test(simple_value(value))
+
+            # Like the row by row filter, each filter is only tested on the
+            # rows that have passed all the earlier ones
+            mask = column.mask(fn, mask)
+
+        rowset_stats['filter_rowsets'] += 1
+        return self._take(numpy.flatnonzero(mask))
+
+    def _group_by(self, field):
+        """Group the rowset by the given row field and return groups as a dict
+        """
+        try:
+            column = self._column(field)
+        except TypeError:
+            # the field values cannot be used as a dict key
+            return super()._group_by(field)
+
+        if field == 'month':
+            # If we have no date, then we cannot be grouped by that!
+            keep = self._column('date').mask(lambda date: date is not None)
+        else:
+            keep = numpy.ones(len(self.rows), dtype=bool)
+
+        # Find the list of codes that belong to each resulting key
+        keys = {}
+        for code, value in enumerate(column.categories):
+            if value is None or value is _MISSING:
+                value = 'unknown'
+            keys.setdefault(value, []).append(code)
+
+        # A stable sort keeps the original row order within each group
+        order = numpy.argsort(column.codes, kind='stable')
+        bounds = numpy.searchsorted(
+            column.codes[order],
+            numpy.arange(len(column.categories) + 1)
+        )
+
+        result = {}
+        for key, codes in keys.items():
+            indices = numpy.concatenate(
+                [order[bounds[code]:bounds[code+1]] for code in codes]
+            )
+            if len(codes) > 1:
+                indices.sort(kind='stable')
+            indices = indices[keep[indices]]
+            if len(indices):
+                result[key] = self._take(indices)
+
+        return result
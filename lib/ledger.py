@@ -0,0 +1,126 @@
+# Licensed under GPLv3
+import os
+
+import row
+import timing
+from rowset import RowSet
+
+
+class Ledger(object):
+    """The loaded cash data, kept in memory so that it can be used for
+    many reports - with the split and future variants of the rows each
+    only built once, when first asked for.
+
+    refresh() looks for changed files, and only those are parsed again.
+    """
+
+    def __init__(self, dirname, rowset_class=RowSet, index=False, jobs=1,
+                 cache=None):
+        self.dirname = dirname
+        self.rowset_class = rowset_class
+        self.index = index
+        self.jobs = jobs
+        self.cache = cache
+
+        # All the rows loaded, and if the future ones are included
+        self._rows = None
+        self._withfuture = False
+
+        self.main = None
+        self.future = None
+        self._variants = {}
+
+    def load(self):
+        """Load all the data from the main directory.  The future data is
+        only loaded when it is first asked for
+        """
+        rows = self.rowset_class()
+        if self.index:
+            rows.index_by()
+        with timing.stage('load_directory'):
+            rows.load_directory(self.dirname, jobs=self.jobs,
+                                cache=self.cache)
+
+        self._rows = rows
+        self._withfuture = False
+        self._loaded()
+
+    def _load_future(self):
+        # The future rows follow on from the main ones
+        with timing.stage('includefuture load'):
+            self._rows.load_directory(
+                os.path.join(self.dirname, 'future'),
+                skip_balance_check=True,
+                jobs=self.jobs,
+                cache=self.cache
+            )
+            self._withfuture = True
+            self._loaded()
+
+    def _loaded(self):
+        if self._withfuture:
+            self.main = self._rows.loaded_from(self.dirname)
+            self.future = self._rows
+        else:
+            self.main = self._rows
+            self.future = None
+        self._variants = {}
+
+    def refresh(self):
+        """Load again any files that have changed, returning their names
+        """
+        if self._rows is None:
+            self.load()
+            return []
+
+        changed = self._rows.reload(self.cache)
+        if changed:
+            self._loaded()
+        return changed
+
+    def rows(self, includefuture=False, split=True, window=None,
+             filter_strings=None):
+        """Return the RowSet for the given variant of the data, with any
+        filters applied.
+
+        The unfiltered variants are remembered and reused.  As the split
+        rows depend on the as-of date (for the open ended forecasts), only
+        those for the current date are kept.
+        """
+        if self._rows is None:
+            self.load()
+        if includefuture and not self._withfuture:
+            self._load_future()
+
+        key = (includefuture, split, window)
+        asof = row.asof()
+        known = self._variants.get(key)
+        if known is not None and known[0] != asof:
+            known = None
+
+        if known is not None:
+            if filter_strings:
+                with timing.stage('filter'):
+                    return known[1].filter(filter_strings)
+            return known[1]
+
+        if includefuture:
+            result = self.future
+        else:
+            result = self.main
+
+        if filter_strings:
+            # Nothing to reuse, so filter while splitting and do not keep
+            # the result - a one-off run only wants the filtered rows
+            if split:
+                with timing.stage('autosplit and filter'):
+                    return result.autosplit(filter_strings, window)
+            with timing.stage('filter'):
+                return result.filter(filter_strings)
+
+        if split:
+            with timing.stage('autosplit'):
+                result = result.autosplit(window=window)
+
+        self._variants[key] = (asof, result)
+        return result
@@ -1,8 +1,13 @@
 # Licensed under GPLv3
 import datetime
 import calendar
+import functools
+import operator
 import decimal
 import re
+import sys
+
+import tagschema
 
 
 # TODO
@@ -12,10 +17,212 @@ import re
 #   transactions (or even just one with more than 3 months...)
 # - update Row __init__ to enforce that value is a number
 
+# Used to convert the stored cents into the number of decimal places wanted
+_CENTS_SCALE = (100, 10, 1)
+
+# The regex used to find each type of tag within a comment
+_XTAG_RE = {
+    '#': re.compile(r'#([A-Za-z:]\S*)'),
+    '!': re.compile(r'!([A-Za-z:]\S*)'),
+}
+
+# Overall counts of the work done on rows, to find what is doing too much.
+# Rows parsed in worker processes (see RowSet.load_directory) or found in
+# the RowCache are not validated here, so are not counted.  The regexes
+# compiled for the tag schema are counted in tagschema.tagschema_stats
+row_stats = {
+    'tag_validations': 0,
+    'filter_compilations': 0,
+    'regex_compilations': 0,
+    'filter_evaluations': 0,
+    'autosplit_children': 0,
+}
+
+
+def simple_value(attr):
+    """return the attr value as a simple number or string
+    """
+    if isinstance(attr, (int, str, decimal.Decimal)):
+        return attr
+
+    if attr is None:
+        return None
+
+    # convert all 'complex' types into string representations
+    return str(attr)
+
+
+# The date that relative dates (like rel_months) are worked out from.  When
+# it is not set, the current date is used every time it is needed
+_asof = None
+_asof_month_ordinal = None
+
+
+def set_asof(date):
+    """Set the date that all the relative dates are worked out from, or
+    None to use the current date.  Returns the previous setting, so that it
+    can be put back afterwards
+    """
+    global _asof, _asof_month_ordinal
+    previous = _asof
+    _asof = date
+    _asof_month_ordinal = None
+    if date is not None:
+        _asof_month_ordinal = date.replace(day=1).toordinal()
+    return previous
+
+
+def asof():
+    """Return the date that the relative dates are worked out from
+    """
+    if _asof is not None:
+        return _asof
+    return datetime.datetime.now().date()
+
+
+# Every row in the same month shares the same month date object
+_MONTHS = {}
+
+
+def _month_of(date):
+    """return the first of the month of the given date
+    """
+    key = (date.year, date.month)
+    month = _MONTHS.get(key)
+    if month is None:
+        month = date.replace(day=1)
+        _MONTHS[key] = month
+    return month
+
+
+@functools.lru_cache(maxsize=None)
+def _taxyearhk_of(month):
+    if month.month < 4:
+        year = month.year
+    else:
+        year = month.year + 1
+
+    return "ye{}".format(year)
+
+
+def _month_last_day(date):
+    """return the date of the last day in the month of the given date
+    """
+    return date.replace(day=calendar.monthrange(date.year, date.month)[1])
+
+
+class Filter(object):
+    """A human readable "<key><op><value>" filter, compiled once so that it
+    can be cheaply tested against many rows
+    """
+
+    # The comparison ops, the regex ops are handled separately
+    _ops = {
+        '==': operator.eq,
+        '!=': operator.ne,
+        '>': operator.gt,
+        '<': operator.lt,
+        '>=': operator.ge,
+        '<=': operator.le,
+    }
+
+    def __init__(self, string):
+        # its not a real tokeniser, its just a RE. so, now I have two problems
+        m = re.match("([a-z0-9_]+)([=!<>~]{1,2})(.*)", string, re.I)
+        if not m:
+            raise ValueError('filters must be <key><op><value>')
+
+        self.string = string
+        (self.field, self.op, self.value) = m.groups()
+        self.regex = None
+        self._compare = None
+        row_stats['filter_compilations'] += 1
+
+        if self.op in ('=~', '!~'):
+            self.regex = re.compile(self.value, re.I)
+            row_stats['regex_compilations'] += 1
+        elif self.op in self._ops:
+            self._compare = self._ops[self.op]
+
+            # coerce our value to match into a number, if that looks possible
+            try:
+                self.value = float(self.value)
+            except ValueError:
+                pass
+        else:
+            raise ValueError('Unknown filter operation "{}"'.format(self.op))
+
+    def __repr__(self):
+        return 'Filter({!r})'.format(self.string)
+
+    @classmethod
+    @functools.lru_cache(maxsize=1024)
+    def _compile_str(cls, string):
+        return cls(string)
+
+    @classmethod
+    def compile(cls, string):
+        """Return the Filter for the given string, reusing any previously
+        compiled one.  A Filter object is returned unchanged
+        """
+        if isinstance(string, Filter):
+            return string
+        return cls._compile_str(string)
+
+    def test(self, value_now):
+        """Check if the simple value of our field matches this filter
+        """
+        if self.field == 'month':
+            # HACK - months are datetime objects, but to compare with the
+            # user supplied string, we need to strip off the date
+            # - there is no similar hack in the match() method, should there?
+            value_now = value_now[0:7]
+
+        if self.regex is not None:
+            # FIXME TODO HACK
+            # - the old _getvalue_simple always coerced None into str('None'),
+            #   which was not the intention, however the re.search matches
+            #   turn out to rely on that
+            found = self.regex.search(str(value_now)) is not None
+            if self.op == '=~':
+                return found
+            return not found
+
+        if value_now is None:
+            # FIXME TODO HACK
+            # - python 2 silently compared str('None') to 0 and worked
+            # - python 3 complains
+            # - This code turns out to rely on the python 2 comparison
+            # As a hack, if we detect this, pretend None is very negative
+            value_now = float('-inf')
+
+        return self._compare(value_now, self.value)
+
+    def match(self, row):
+        """Check if the given row matches this filter
+        """
+        row_stats['filter_evaluations'] += 1
+        return self.test(row._getvalue_simple(self.field))
+
 
 class Row(object):
     """A generic row type"""
 
+    # There can be a very large number of rows loaded, so keep each one small.
+    # The value, date and comment are stored in these slots, but subclasses
+    # may keep their own forms of them there (see RowData), so they are
+    # always reached through the properties below
+    __slots__ = ('hashtag', '_value', '_date', '_comment')
+
+    # Fields that only have real values in some of the subclasses
+    direction = None
+    month = None
+    rel_months = None
+    isforecast = False
+    isdata = False
+    location = None
+    taxyearhk = None
+
     @classmethod
     def fromTxt(cls, text):
         """Return a new object constructed from the given input text line"""
@@ -47,31 +254,66 @@ class Row(object):
         return self.__add__(other)
 
     def __init__(self):
-        self.value = 0
-        self.date = None
-        self.comment = None
-        self.direction = None
+        self._value = 0
+        self._date = None
+        self._comment = None
         self.hashtag = None
-        self.month = None
-        self.rel_months = None
-        self.isforecast = False
-        self.isdata = False
-        self.location = None
-        self.taxyearhk = None
 
-    def _getvalue_simple(self, field):
-        """return the field value as a simple number or string
-        """
-        attr = getattr(self, field)
+    @property
+    def value(self):
+        return self._value
 
-        if isinstance(attr, (int, str, decimal.Decimal)):
-            return attr
+    @value.setter
+    def value(self, value):
+        self._value = value
 
-        if attr is None:
-            return None
+    @property
+    def date(self):
+        return self._date
+
+    @date.setter
+    def date(self, date):
+        self._date = date
+
+    @property
+    def comment(self):
+        return self._comment
 
-        # convert all 'complex' types into string representations
-        return str(attr)
+    @comment.setter
+    def comment(self, comment):
+        self._comment = comment
+
+    def _slots(self):
+        """Iterate over all the slot descriptors used by this object
+        """
+        for cls in type(self).__mro__:
+            for name in cls.__dict__.get('__slots__', ()):
+                yield name, cls.__dict__[name]
+
+    # Pickle (as used by the RowCache) needs to see the stored values
+    # directly, not the properties that some subclasses have in front of them
+    def __getstate__(self):
+        state = {}
+        for name, slot in self._slots():
+            try:
+                state[name] = slot.__get__(self)
+            except AttributeError:
+                # this slot was never set
+                pass
+        return state
+
+    def __setstate__(self, state):
+        for name, slot in self._slots():
+            if name in state:
+                value = state[name]
+                if isinstance(value, str):
+                    value = sys.intern(value)
+                slot.__set__(self, value)
+
+    def _getvalue_simple(self, field):
+        """return the field value as a simple number or string
+        """
+        return simple_value(getattr(self, field))
 
     def match(self, **kwargs):
         """using kwargs, check if this Row matches if so, return it, or None
@@ -87,86 +329,11 @@ class Row(object):
         """Using the given human readable filter, check if this row matches
            and if so, return it, or None
         """
+        if Filter.compile(string).match(self):
+            return self
+        return None
 
-        # its not a real tokeniser, its just a RE. so, now I have two problems
-        m = re.match("([a-z0-9_]+)([=!<>~]{1,2})(.*)", string, re.I)
-        if not m:
-            raise ValueError('filters must be <key><op><value>')
-
-        field = m.group(1)
-        op = m.group(2)
-        value_match = m.group(3)
-        value_now = self._getvalue_simple(field)
-
-        if field == 'month':
-            # HACK - months are datetime objects, but to compare with the
-            # user supplied string, we need to strip off the date
-            # - there is no similar hack in the match() method, should there?
-            value_now = value_now[0:7]
-
-        # FIXME TODO HACK
-        # - the old _getvalue_simple always coerced None into str('None'),
-        #   which was not the intention, however the re.search matches
-        #   turn out to rely on that
-        value_now_str = str(value_now)
-
-        if op == '=~':
-            if re.search(value_match, value_now_str, re.I):
-                return self
-            return None
-
-        if op == '!~':
-            if not re.search(value_match, value_now_str, re.I):
-                return self
-            return None
-
-        if value_now is None:
-            # FIXME TODO HACK
-            # - python 2 silently compared str('None') to 0 and worked
-            # - python 3 complains
-            # - This code turns out to rely on the python 2 comparison
-            # As a hack, if we detect this, pretend None is very negative
-            value_now = float('-inf')
-
-        # coerce our value to match into a number, if that looks possible
-        try:
-            value_match = float(value_match)
-        except ValueError:
-            pass
-
-        if op == '==':
-            if value_now == value_match:
-                return self
-            return None
-
-        if op == '!=':
-            if value_now != value_match:
-                return self
-            return None
-
-        if op == '>':
-            if value_now > value_match:
-                return self
-            return None
-
-        if op == '<':
-            if value_now < value_match:
-                return self
-            return None
-
-        if op == '>=':
-            if value_now >= value_match:
-                return self
-            return None
-
-        if op == '<=':
-            if value_now <= value_match:
-                return self
-            return None
-
-        raise ValueError('Unknown filter operation "{}"'.format(op))
-
-    def autosplit(self, method=None):
+    def autosplit(self, method=None, window=None):
         return [self]
 
     def _split_locn_xfer(self):
@@ -177,6 +344,8 @@ class Row(object):
 class RowComment(Row):
     """A row containing a comment"""
 
+    __slots__ = ()
+
     def __init__(self, comment):
         super().__init__()
         self.comment = comment
@@ -190,6 +359,8 @@ class RowComment(Row):
 class RowPragma(Row):
     """A row containing a pragma command"""
 
+    __slots__ = ()
+
     @classmethod
     def fromTxt(cls, text):
         if text[0] != '#':
@@ -216,6 +387,8 @@ class RowPragmaBalance(RowPragma):
     # TODO
     # - move more of the pragma processing into this class
 
+    __slots__ = ('balance',)
+
     def __init__(self, balance, comment):
         super().__init__()
         self.balance = decimal.Decimal(balance)
@@ -236,6 +409,16 @@ class RowData(Row):
     # TODO - change the way CSV works and remove this
     _fields = ['value', 'date', 'comment']
 
+    # The value is stored (in _value) as an integer number of cents, along
+    # with the number of decimal places it was written with (so that it can
+    # be output again unchanged).  The Decimal is only created when asked
+    # for.  The _comment has the tags replaced by placeholders
+    __slots__ = (
+        '_tags', '_places', '_month', '_month_ordinal', '_rendered',
+    )
+
+    isdata = True
+
     def __str__(self):
         """Output the same format as input file - allowing roundtripping"""
 
@@ -253,13 +436,12 @@ class RowData(Row):
             raise ValueError("{} is not a date object".format(date))
 
         self.hashtag = None
-        self.bangtags = dict()
-        self.value = decimal.Decimal(value)
+        self._tags = dict()
+        self.value = value
         self.date = date
         self.comment = comment
-        self.isdata = True
 
-        if 'months' in self.bangtags and 'forecast' in self.bangtags:
+        if 'months' in self._tags and 'forecast' in self._tags:
             raise ValueError('Cannot have both months and forecast bang tags')
 
     # Implement len and getitem so that this object can be used with the
@@ -272,6 +454,40 @@ class RowData(Row):
         attr = self._fields[i]
         return getattr(self, attr)
 
+    @property
+    def value(self):
+        return decimal.Decimal(
+            self._value // _CENTS_SCALE[self._places]
+        ).scaleb(-self._places)
+
+    @value.setter
+    def value(self, value):
+        value = decimal.Decimal(value)
+        if not value.is_finite():
+            raise ValueError("{} is not a cash value".format(value))
+
+        places = max(0, -value.as_tuple().exponent)
+        if places > 2:
+            raise ValueError(
+                "{} is not a whole number of cents".format(value))
+
+        self._value = int(value * 100)
+        self._places = places
+
+    @property
+    def date(self):
+        return self._date
+
+    @date.setter
+    def date(self, date):
+        self._date = date
+        if date is None:
+            self._month = None
+            self._month_ordinal = None
+        else:
+            self._month = _month_of(date)
+            self._month_ordinal = self._month.toordinal()
+
     @property
     def direction(self):
         if self.value < 0:
@@ -285,7 +501,7 @@ class RowData(Row):
            - used for the filter language
              (others should just use the date object)
         """
-        return self.date.replace(day=1)
+        return self._month
 
     @property
     def taxyearhk(self):
@@ -296,12 +512,7 @@ class RowData(Row):
             Return a string that clearly identifies the tax year this
             object is part of.
         """
-        if self.date.month < 4:
-            year = self.date.year
-        else:
-            year = self.date.year + 1
-
-        return "ye{}".format(year)
+        return _taxyearhk_of(self._month)
 
     def category_prefix(self, level):
         """
@@ -323,9 +534,10 @@ class RowData(Row):
 
     @property
     def rel_months(self):
-        now = datetime.datetime.now().date()
-        month_now = now.replace(day=1)
-        rel_days = (self.month - month_now).days
+        month_now = _asof_month_ordinal
+        if month_now is None:
+            month_now = asof().replace(day=1).toordinal()
+        rel_days = self._month_ordinal - month_now
 
         # approximate the relative number of months with 28 days per month.
         # for large enough relative values, this will be inaccurate.
@@ -335,20 +547,33 @@ class RowData(Row):
     @property
     def comment(self):
         """Re-insert the tags into the comment"""
+
+        # The rendered comment is remembered along with the hashtag it was
+        # made from.  It is forgotten whenever the bangtags could have been
+        # changed (see the bangtags property)
+        rendered = self._rendered
+        if rendered is not None:
+            hashtag, comment = rendered
+            if hashtag is self.hashtag:
+                return comment
+
         tags = dict()
         if self.hashtag:
             tags['hashtag'] = '#'+self.hashtag
 
-        for k, v in self.bangtags.items():
+        for k, v in self._tags.items():
             fields = v.copy()
             fields.insert(0, k)
             tags['bangtag,'+k] = '!' + ':'.join(fields)
 
-        return self._comment.format(**tags)
+        comment = self._comment.format(**tags)
+        self._rendered = (self.hashtag, comment)
+        return comment
 
     @comment.setter
     def comment(self, newcomment):
         self._comment = newcomment
+        self._rendered = None
 
         # Look at the comment for this row and extract the various types of
         # tags found.
@@ -358,80 +583,34 @@ class RowData(Row):
         self._hashtag()
         self._bangtags()
 
+    @property
+    def bangtags(self):
+        """The dict of bangtag names and their list of args.  As the caller
+        could change them, the rendered comment is forgotten
+        """
+        self._rendered = None
+        return self._tags
+
+    @bangtags.setter
+    def bangtags(self, bangtags):
+        self._tags = bangtags
+        self._rendered = None
+
     @property
     def isforecast(self):
-        return ('forecast' in self.bangtags)
+        return ('forecast' in self._tags)
 
     @property
     def location(self):
-        if 'locn' in self.bangtags:
-            return self.bangtags['locn'][0]
+        if 'locn' in self._tags:
+            return self._tags['locn'][0]
         return None
 
     def _xtag_validate(self, x, tag):
         """Check the tag against valid tag names
         """
-
-        # TODO:
-        # load these lists from a file
-
-        valid = {
-            '#': [
-                'bills:accounting',
-                'bills:br',
-                'bills:dns',
-                'bills:electricity',
-                'bills:hosting',
-                'bills:internet',
-                'bills:meetup',
-                'bills:rent',
-                'bills:upkeep',
-                'bills:water',
-                'bookshelves',
-                'donation',
-                'donation:c3',
-                'donation:members',
-                'dues:[a-z][a-z0-9]*',
-                'fees:paypal',
-                'fridge',
-                'loan',
-                'merch:[a-z][a-z0-9]*',
-                'recycling',
-                'supporters',
-                'test_hashtag',
-                'test_hashtag2(:.*)?',
-                'workshop',
-            ],
-            '!': [
-                'forecast(:.*)?',
-                'id:paypal:[0-9ABCDEFGHJKLMNPRSTUVWXY]{17}',
-                'id:cac:[0-9]+',
-                'locn:gary',
-                'locn:hamish',
-                'locn:nic',
-                'locn:paypal',
-                'locn:philip',
-                'locn:test_location',
-                'locn:test_location2',
-                'locn_xfer:.*',
-                'months:[-0-9]+(:[0-9]+)?',
-                'test_bangtag',
-                'test_bangtag2(:.*)?',
-            ],
-        }
-
-        if x not in valid:
-            raise ValueError("Unknown tag type {}".format(x))
-
-        # TODO: constructing the regex could be optimised ..
-        items = []
-        for i in valid[x]:
-            items.append('(^' + i + '$)')
-        regex = '|'.join(items)
-        p = re.compile(regex)
-
-        if p.match(tag) is None:
-            raise ValueError("Unknown tag {}{}".format(x, tag))
+        row_stats['tag_validations'] += 1
+        tagschema.default().validate(x, tag)
 
     def _xtag(self, x):
         """Generically extract tags with a given prefix
@@ -444,8 +623,7 @@ class RowData(Row):
         # - should a tag char start a tag /anywhere/ in the string?
         # - how do we detect syntax errors like "xyz id!:paypal:foo abc"?
 
-        p = re.compile(x+r'([A-Za-z:]\S*)')
-        all_tags = p.findall(self._comment)
+        all_tags = _XTAG_RE[x].findall(self._comment)
 
         for tag in all_tags:
             self._xtag_validate(x, tag)
@@ -463,22 +641,23 @@ class RowData(Row):
         if not hashtags:
             return
 
-        hashtag = hashtags[0]
+        hashtag = sys.intern(hashtags[0])
         self.hashtag = hashtag
 
-        self._comment = re.sub(r'#'+hashtag, '{hashtag}', self._comment)
+        self._comment = self._comment.replace('#'+hashtag, '{hashtag}')
 
     def _set_bangtag(self, tagname, args):
         """Set a bangtag property"""
         if tagname != tagname.lower():
             raise ValueError('bangtag {} is not lowercase'.format(tagname))
-        if tagname in self.bangtags:
+        if tagname in self._tags:
             raise ValueError('Row has multiple !{} tags'.format(tagname))
 
         # TODO:
         # - should args be a known case too?
 
-        self.bangtags[tagname] = args
+        self._tags[tagname] = args
+        self._rendered = None
 
     def _bangtags(self):
         """Extract any bangtags from the comment"""
@@ -489,7 +668,7 @@ class RowData(Row):
             return
 
         for bangtag in bangtags:
-            fields = bangtag.split(':')
+            fields = [sys.intern(x) for x in bangtag.split(':')]
             tagname = fields.pop(0)
 
             self._set_bangtag(tagname, fields)
@@ -497,7 +676,7 @@ class RowData(Row):
             # If this bangtag is in the original comment, ensure updates get
             # propogated back to it when rendered
             replacement = '{bangtag,'+tagname+'}'
-            self._comment = re.sub(r'!'+bangtag, replacement, self._comment)
+            self._comment = self._comment.replace('!'+bangtag, replacement)
 
     @staticmethod
     def _month_add(date, incr):
@@ -532,10 +711,10 @@ class RowData(Row):
         """extract any !months tag and use that to calculate the list of
            dates that this row could be split into
         """
-        if 'months' not in self.bangtags:
+        if 'months' not in self._tags:
             return [self.date]
 
-        fields = self.bangtags['months']
+        fields = self._tags['months']
 
         if len(fields) < 1 or len(fields) > 2:
             raise ValueError('months bang must specify one or two numbers')
@@ -567,7 +746,7 @@ class RowData(Row):
         # - the split/autosplit/nosplit distinction is more blurry
         #   with this feature.  Fix this!
 
-        if 'locn_xfer' not in self.bangtags:
+        if 'locn_xfer' not in self._tags:
             return [self]
 
         if self.value != 0:
@@ -578,29 +757,50 @@ class RowData(Row):
         # - validate the from and to location names as being from
         #   the list of allowed locations
 
-        source = self.bangtags['locn_xfer'][0]
-        dest = self.bangtags['locn_xfer'][1]
-        amount = decimal.Decimal(self.bangtags['locn_xfer'][2])
+        source = self._tags['locn_xfer'][0]
+        dest = self._tags['locn_xfer'][1]
+        amount = decimal.Decimal(self._tags['locn_xfer'][2])
 
-        # FIXME: DRY
-        row_source = RowData(-amount, self.date, self._comment)
-        row_source.comment = self.comment + ' !locn:{}'.format(source)
+        rows = []
+        for value, location in ((-amount, source), (amount, dest)):
+            new = self._child(value, self.date)
+
+            # add a location tag, just as if it was in the comment
+            self._xtag_validate('!', 'locn:' + location)
+            new._comment += ' {bangtag,locn}'
+            new._set_bangtag('locn', [sys.intern(location)])
 
-        # mutate the bangtags to show this is a child
-        row_source._set_bangtag('child', ['locn_xfer'])
+            # mutate the bangtags to show this is a child
+            new._set_bangtag('child', ['locn_xfer'])
 
-        # FIXME: DRY
-        row_dest = RowData(amount, self.date, self._comment)
-        row_dest.comment = self.comment + ' !locn:{}'.format(dest)
+            rows.append(new)
 
-        # mutate the bangtags to show this is a child
-        row_dest._set_bangtag('child', ['locn_xfer'])
+        return rows
 
-        return [row_source, row_dest]
+    def _child(self, value, date):
+        """Return a new row with the given value and date, and with the
+        same comment and tags as this one.
 
-    def _autosplit_forecast(self):
-        """split forecast monthly reoccuring items into one for each month"""
-        args = self.bangtags['forecast']
+        The tags are copied from this already parsed row instead of
+        parsing the comment again.  The child has its own copy of the
+        bangtags, which can be changed without changing this row
+        """
+        new = RowData.__new__(RowData)
+        new.value = value
+        new.date = date
+        new.hashtag = self.hashtag
+        new._tags = {k: list(v) for k, v in self._tags.items()}
+        new._comment = self._comment
+        new._rendered = None
+        return new
+
+    def _autosplit_forecast(self, window=None):
+        """split forecast monthly reoccuring items into one for each month
+
+        If a (start, end) window of dates is given, only the children in
+        months that overlap it are created
+        """
+        args = self._tags['forecast']
 
         if not args:
             # This is a singleton forecast line
@@ -617,19 +817,31 @@ class RowData(Row):
             lastdate = datetime.datetime.strptime(
                     args[2].strip(), "%Y-%m-%d").date()
         else:
-            lastdate = self._month_add(datetime.datetime.now().date(), 6)
+            lastdate = self._month_add(asof(), 6)
+
+        if self.date > lastdate:
+            # There are no children at all
+            return None
+
+        start = end = None
+        if window is not None:
+            start, end = window
 
         rows = []
         this = self.date
         while this <= lastdate:
-            new = RowData(self.value, this, self._comment)
-            if self.hashtag:
-                new.hashtag = self.hashtag
+            if end is not None and this.replace(day=1) > end:
+                # nothing later can be in the window
+                break
+
+            if start is not None and _month_last_day(this) < start:
+                this = self._month_add(this, 1)
+                continue
 
-            new.bangtags = self.bangtags.copy()
+            new = self._child(self.value, this)
 
             # mutate the bangtags to show this is a child
-            new.bangtags['forecast'][0] = 'child'
+            new._tags['forecast'] = ['child'] + args[1:]
 
             rows.append(new)
 
@@ -637,8 +849,11 @@ class RowData(Row):
 
         return rows
 
-    def autosplit(self):
+    def autosplit(self, window=None):
         """look at the split bangtag and return a split row if needed
+
+        The window limits the forecast children that are made, see
+        _autosplit_forecast()
         """
 
         # TODO
@@ -647,7 +862,7 @@ class RowData(Row):
 
         rows = []
 
-        if 'months' in self.bangtags:
+        if 'months' in self._tags:
             # we have a transaction to split
 
             dates = self._split_dates()
@@ -681,25 +896,24 @@ class RowData(Row):
             for date in dates:
                 this_value = each_value + remainder
                 remainder = 0  # only add the remainder to the first child
-                new = RowData(this_value, date, self._comment)
-                if self.hashtag:
-                    new.hashtag = self.hashtag
-
-                new.bangtags = self.bangtags.copy()
+                new = self._child(this_value, date)
 
                 # mutate the bangtags to show this is a child
-                new.bangtags['months'] = ['child']
+                new._tags['months'] = ['child']
 
                 rows.append(new)
 
+            row_stats['autosplit_children'] += len(rows)
             return rows
 
-        if 'forecast' in self.bangtags:
-            rows = self._autosplit_forecast()
+        rows = None
+        if 'forecast' in self._tags:
+            rows = self._autosplit_forecast(window)
 
-        if not rows:
+        if rows is None:
             return [self]
 
+        row_stats['autosplit_children'] += len(rows)
         return rows
 
         # elif method == 'proportional':
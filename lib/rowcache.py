@@ -0,0 +1,146 @@
+# Licensed under GPLv3
+import hashlib
+import pickle
+import glob
+import time
+import sys
+import os
+
+import tagschema
+
+
+def cache_dir(name):
+    """Return the default directory used to store the named cache
+    """
+    base = os.environ.get('XDG_CACHE_HOME')
+    if not base:
+        base = os.path.join(os.path.expanduser('~'), '.cache')
+    return os.path.join(base, 'dsl-accounts', name)
+
+
+_code_version = None
+
+
+def code_version():
+    """Return a string that changes whenever the parsing code changes.
+
+    Any cached rows are only valid for the code that created them, so this
+    is a hash of the source of the modules used when parsing.
+    """
+    global _code_version
+    if _code_version is None:
+        libdir = os.path.dirname(os.path.abspath(__file__))
+        h = hashlib.sha256()
+        h.update(sys.version.encode())
+        for name in ('row.py', 'rowset.py', 'rowcache.py',
+                     'tagschema.py', tagschema.DEFAULT_FILENAME):
+            with open(os.path.join(libdir, name), 'rb') as f:
+                h.update(f.read())
+        _code_version = h.hexdigest()
+    return _code_version
+
+
+class RowCache(object):
+    """An on-disk cache of the Row objects parsed from each cash file,
+    keyed on the file contents and the code version.
+
+    Every edit to a file makes a new entry, so whenever an entry is written
+    the entries for other code versions, and any not used for max_age
+    seconds, are removed.
+    """
+
+    # How long an entry is kept without being used
+    max_age = 30 * 24 * 60 * 60
+
+    def __init__(self, dirname=None):
+        if dirname is None:
+            dirname = cache_dir('rows')
+        self.dirname = dirname
+        self._pruned = False
+
+    @staticmethod
+    def _prefix():
+        """Return the start of the names of the entries for this code
+        version
+        """
+        return code_version()[:16] + '-'
+
+    def _filename(self, content):
+        h = hashlib.sha256(content.encode())
+        return os.path.join(self.dirname,
+                            self._prefix() + h.hexdigest() + '.pickle')
+
+    def get(self, content):
+        """Return the list of rows previously parsed from this content,
+        or None if there is no usable entry
+        """
+        filename = self._filename(content)
+        try:
+            with open(filename, 'rb') as f:
+                rows = pickle.load(f)
+        except Exception:
+            # A missing or broken entry is just a cache miss
+            return None
+
+        if not isinstance(rows, list):
+            return None
+
+        # Remember that the entry is still in use
+        try:
+            os.utime(filename)
+        except OSError:
+            pass
+        return rows
+
+    def put(self, content, rows):
+        """Store the list of rows parsed from this content
+        """
+        filename = self._filename(content)
+        tmpname = '{}.{}.tmp'.format(filename, os.getpid())
+        try:
+            os.makedirs(self.dirname, exist_ok=True)
+            with open(tmpname, 'wb') as f:
+                pickle.dump(rows, f, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(tmpname, filename)
+        except OSError:
+            # Failing to write the cache should never stop the data loading
+            try:
+                os.unlink(tmpname)
+            except OSError:
+                pass
+
+        # Only a new entry can have left an old one unused, so this is the
+        # time to look for them, but once is enough
+        if not self._pruned:
+            self._pruned = True
+            self.prune()
+
+    def prune(self, now=None):
+        """Remove the entries made by other code versions and those not used
+        for max_age seconds, returning how many were removed
+        """
+        if now is None:
+            now = time.time()
+        prefix = self._prefix()
+
+        count = 0
+        for filename in glob.glob(os.path.join(self.dirname, '*.pickle')):
+            try:
+                if (os.path.basename(filename).startswith(prefix)
+                        and os.stat(filename).st_mtime >= now - self.max_age):
+                    continue
+                os.unlink(filename)
+            except OSError:
+                # Perhaps another process removed it first
+                continue
+            count += 1
+        return count
+
+    def clear(self):
+        """Remove all the cache entries, returning how many were removed
+        """
+        count = 0
+        for filename in glob.glob(os.path.join(self.dirname, '*.pickle')):
+            os.unlink(filename)
+            count += 1
+        return count
@@ -1,22 +1,329 @@
 # Licensed under GPLv3
 import decimal
+import hashlib
+import bisect
+import collections
+import collections.abc
 import os
 import sys
 import glob
+import functools
+import time
+
+from io import StringIO
 
 from row import Row
 from row import RowPragmaBalance
 from row import RowData
+from row import Filter
+from row import simple_value
+
+
+def _parse_lines(lines, filename):
+    """Given the text lines from one file, return a list of Row objects
+    """
+    rows = []
+    line_number = 0
+    last_error = None
+    for row in lines:
+        row = row.rstrip('\n')
+        line_number += 1
+
+        try:
+            rows.append(Row.fromTxt(row))
+        except Exception as e:
+            print("{}:{} Syntax error".format(filename, line_number), file=sys.stderr)
+            last_error = e
+
+    if last_error is not None:
+        print("Error: at least one syntax error. Trace is from last", file=sys.stderr)
+        raise last_error
+
+    return rows
+
+
+def _parse_content(content, filename, cache=None):
+    """Parse the whole text of one file, using the cache if one is given
+    """
+    if cache is not None:
+        rows = cache.get(content)
+        if rows is not None:
+            return rows
+
+    rows = _parse_lines(StringIO(content).readlines(), filename)
+
+    if cache is not None:
+        cache.put(content, rows)
+    return rows
+
+
+def _content_digest(content):
+    """Return a hash of the text of one file
+    """
+    return hashlib.sha256(content.encode()).hexdigest()
+
+
+def _parse_file(filename, cache=None):
+    """Read and parse one file - this is the unit of work given to each
+    process when loading in parallel.  Returns the hash of the text that
+    was parsed, along with the list of rows
+    """
+    with open(filename, 'r') as stream:
+        content = stream.read()
+    return (_content_digest(content), _parse_content(content, filename, cache))
+
+
+def _file_stat(filename):
+    """Return the stat() details that change when the file is written to
+    """
+    stat = os.stat(filename)
+    return (stat.st_mtime_ns, stat.st_size)
+
+
+def _file_digest(filename):
+    """Return a hash of the file contents
+    """
+    with open(filename, 'r') as stream:
+        return _content_digest(stream.read())
+
+
+class _Source(object):
+    """One file loaded into a RowSet by load_directory(), with what is needed
+    to tell if it has changed and to undo its loading
+    """
+    __slots__ = ('filename', 'stat', 'digest', 'rows', 'start', 'state')
+
+    def __init__(self, filename, stat, digest, rows, start, state):
+        self.filename = filename
+        self.stat = stat
+        self.digest = digest
+        self.rows = rows
+        # Where the rows were added and the RowSet totals before that
+        self.start = start
+        self.state = state
+
+
+# The fields that are indexed when asked for, without naming them
+INDEX_FIELDS = ('month', 'hashtag', 'location', 'taxyearhk', 'date')
+
+# The fields whose simple values sort in the same order as the values do,
+# so that range filters can binary search their sorted index keys
+_SORTED_FIELDS = ('month', 'date')
+
+# Overall counts of the index use, to see if they are paying for themselves
+index_stats = {
+    'builds': 0,
+    'build_seconds': 0.0,
+    'hits': 0,
+    'misses': 0,
+}
+
+# Overall counts of the group_by memo use
+group_by_stats = {
+    'hits': 0,
+    'misses': 0,
+}
+
+# Overall counts of the work done on RowSets.  The rows of each file loaded
+# are counted whether they were parsed or found in the RowCache
+rowset_stats = {
+    'rows_by_file': {},
+    'filter_rowsets': 0,
+    'group_by_rowsets': 0,
+}
+
+# Used to mark rows that do not have the indexed field at all
+_MISSING = object()
+
+
+class RowIndex(object):
+    """Map each distinct value of a row field onto the positions of the rows
+    with that value
+    """
+
+    def __init__(self, field):
+        self.field = field
+        self.positions = {}
+        self._sorted = None
+
+    def add(self, position, row):
+        key = getattr(row, self.field, _MISSING)
+        positions = self.positions.get(key)
+        if positions is None:
+            self.positions[key] = [position]
+            self._sorted = None
+        else:
+            positions.append(position)
+
+    def _sorted_keys(self):
+        """Return the keys in the order of their simple values
+        """
+        if self._sorted is None:
+            self._sorted = sorted(self.positions.keys(), key=simple_value)
+        return self._sorted
+
+    def _bisect(self, f):
+        """Return the list of keys matching a range filter, found with a
+        binary search.  Only valid when the filter result is monotonic in
+        the sorted keys
+        """
+        keys = self._sorted_keys()
+
+        # the filter is true for either a run at the start or at the end
+        at_start = f.op in ('<', '<=')
+
+        lo = 0
+        hi = len(keys)
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if f.test(simple_value(keys[mid])) == at_start:
+                lo = mid + 1
+            else:
+                hi = mid
+
+        if at_start:
+            return keys[:lo]
+        return keys[lo:]
+
+    def lookup(self, f):
+        """Return the sorted positions of the rows matching the Filter f or
+        None if this index cannot answer it
+        """
+        if _MISSING in self.positions:
+            # let the row by row code produce the error
+            return None
+
+        if (self.field in _SORTED_FIELDS
+                and f.op in ('<', '<=', '>', '>=')
+                and isinstance(f.value, str)
+                and None not in self.positions):
+            keys = self._bisect(f)
+        else:
+            keys = [k for k in self.positions if f.test(simple_value(k))]
+
+        result = []
+        for key in keys:
+            result.extend(self.positions[key])
+        result.sort()
+        return result
+
+
+def _filtered(rows, filters):
+    """Generate the rows that match all the compiled filters, testing each
+    filter only on the rows that have passed the earlier ones
+    """
+    for row in rows:
+        for f in filters:
+            if not f.match(row):
+                break
+        else:
+            yield row
+
+
+class Balance(object):
+    """The total of some rows, and if any of them were forecasts.
+
+    This has the same value and isforecast fields as a RowSet, so the
+    templates can use either one
+    """
+    __slots__ = ('value', 'isforecast')
+
+    def __init__(self, value, isforecast):
+        # ensure that values that have been promoted to have some digits
+        # of significance return to being simple integers when possible.
+        if int(value) == value:
+            value = value.to_integral_exact()
+
+        self.value = value
+        self.isforecast = isforecast
+
+    def __repr__(self):
+        return 'Balance({!r}, {!r})'.format(self.value, self.isforecast)
+
+
+class Period(object):
+    """The opening and closing Balance of one period"""
+    __slots__ = ('opening', 'closing')
+
+    def __init__(self, opening, closing):
+        self.opening = opening
+        self.closing = closing
+
+    def __repr__(self):
+        return 'Period({!r}, {!r})'.format(self.opening, self.closing)
+
+
+def _sort_key(key):
+    # Like the filters do, treat a missing value as lower than any other
+    return (key is not None, key)
 
 
 class RowSet(object):
     """Contain a bunch of rows, allowing statistics to be done on them
+
+    The total value, the forecast taint and the first and last dates (and
+    the first row with the last date) are kept up to date as rows are
+    added.
     """
 
+    # When set, every use of the value re-sums all the rows and checks the
+    # result against the kept total - a debugging aid for catching rows
+    # that were changed after being added
+    check_value = False
+
+    # How many group_by results each RowSet remembers
+    group_by_memo_size = 8
+
     def __init__(self):
         self.rows = []
         self.balance = decimal.Decimal(0)
         self.isforecast = False
+        self.first_date = None
+        self.last_date = None
+        self._last_row = None
+        self._index_fields = ()
+        self._indexes = {}
+        self._group_by_memo = collections.OrderedDict()
+
+        # The directories and files loaded by load_directory()
+        self._directories = []
+        self._sources = []
+        self._pending = None
+
+    def _new(self):
+        """Return a new empty RowSet of the same type and with the same
+        index settings as this one
+        """
+        result = type(self)()
+        result._index_fields = self._index_fields
+        return result
+
+    def index_by(self, fields=INDEX_FIELDS):
+        """Maintain indexes on the given fields for this RowSet and for all
+        the RowSets derived from it.  Each index is built when it is first
+        used by a filter or group_by and kept up to date after that.
+        """
+        self._index_fields = tuple(fields)
+        self._indexes = {}
+
+    def _index(self, field):
+        """Return the index for the field, if it is wanted, building it if
+        needed
+        """
+        if field not in self._index_fields:
+            return None
+
+        index = self._indexes.get(field)
+        if index is None:
+            start = time.perf_counter()
+            index = RowIndex(field)
+            for position, row in enumerate(self.rows):
+                index.add(position, row)
+            self._indexes[field] = index
+
+            index_stats['builds'] += 1
+            index_stats['build_seconds'] += time.perf_counter() - start
+        return index
 
     def __getitem__(self, i):
         return self.rows[i]
@@ -32,12 +339,19 @@ class RowSet(object):
 
     @property
     def value(self):
-        sum = decimal.Decimal(0)
-        for row in self:
-            sum += row.value
+        sum = self.balance
 
-        if self.balance != sum:
-            raise ValueError("here {} {}".format(self.balance, sum))
+        if self.check_value:
+            check = decimal.Decimal(0)
+            for row in self:
+                check += row.value
+            if check != sum:
+                raise ValueError(
+                    'RowSet total is {} but the rows sum to {}'.format(
+                        sum,
+                        check
+                    )
+                )
 
         # ensure that values that have been promoted to have some digits
         # of significance return to being simple integers when possible.
@@ -54,6 +368,22 @@ class RowSet(object):
         #   blaance of the current rowset!!!
         self.rows.append(item)
         self.balance += item.value
+
+        if self._group_by_memo:
+            self._group_by_memo.clear()
+
+        date = getattr(item, 'date', None)
+        if date is not None:
+            if self.first_date is None or date < self.first_date:
+                self.first_date = date
+            if self.last_date is None or date > self.last_date:
+                self.last_date = date
+                self._last_row = item
+
+        if self._indexes:
+            position = len(self.rows) - 1
+            for index in self._indexes.values():
+                index.add(position, item)
         # TODO
         # - since we are recording cash values, it doesnt make sense for the
         #   balance to ever fall below zero.  Consider making that an fatal
@@ -76,22 +406,17 @@ class RowSet(object):
         """
         if isinstance(item, (Row, RowSet)):
             self._add_one_value(item)
-        elif isinstance(item, list):
+        elif isinstance(item, (list, collections.abc.Iterator)):
+            # A generator is consumed one row at a time
             for entry in item:
                 self._add_one_value(entry)
         else:
             raise ValueError('dont know how to append {}'.format(item))
 
-    def load_file(self, stream, skip_balance_check=False):
-        """Given an open file handle, read Row lines into this RowSet
+    def _append_parsed(self, rows, filename, skip_balance_check=False):
+        """Given the list of Row objects parsed from one file, check them
+        against our running balance and add them to this RowSet
         """
-        if isinstance(stream, str):
-            filename = stream
-            stream = open(filename, 'r')
-        else:
-            filename = '(stream)'
-        line_number = 0
-
         need_balance = True
 
         # TODO
@@ -102,17 +427,10 @@ class RowSet(object):
         if skip_balance_check:
             need_balance = False
 
-        last_error = None
-        for row in stream.readlines():
-            row = row.rstrip('\n')
+        line_number = 0
+        for obj in rows:
             line_number += 1
 
-            try:
-                obj = Row.fromTxt(row)
-            except Exception as e:
-                print("{}:{} Syntax error".format(filename, line_number), file=sys.stderr)
-                last_error = e
-
             if isinstance(obj, RowPragmaBalance):
                 # TODO - move more of the pragma logic in to the pragma class
 
@@ -138,22 +456,174 @@ class RowSet(object):
 
             self.append(obj)
 
-        if last_error is not None:
-            print("Error: at least one syntax error. Trace is from last", file=sys.stderr)
-            raise last_error
+    def load_file(self, stream, skip_balance_check=False, cache=None):
+        """Given an open file handle, read Row lines into this RowSet
+
+        If a RowCache is given, any previously parsed rows for the same
+        file contents are used instead of parsing the text again.
+        """
+        if isinstance(stream, str):
+            filename = stream
+            _, rows = _parse_file(filename, cache)
+        else:
+            filename = '(stream)'
+            rows = _parse_content(stream.read(), filename, cache)
+
+        self._append_parsed(rows, filename, skip_balance_check)
 
-    def load_directory(self, dirname, skip_balance_check=False):
+    def _state(self):
+        return (self.balance, self.isforecast, self.first_date,
+                self.last_date, self._last_row)
+
+    def _truncate(self, length, state):
+        """Remove all the rows after the first length, restoring the totals
+        that we had at that point
+        """
+        del self.rows[length:]
+        (self.balance, self.isforecast, self.first_date,
+         self.last_date, self._last_row) = state
+        self._indexes = {}
+        self._group_by_memo.clear()
+
+    def _load_source(self, filename, stat, digest, rows, skip_balance_check):
+        """Add the rows parsed from one file, remembering where they came
+        from for reload()
+        """
+        source = _Source(filename, stat, digest, rows, len(self.rows),
+                         self._state())
+        # Until it has passed the balance checks, it is only partly loaded
+        self._pending = source
+        self._append_parsed(rows, filename, skip_balance_check)
+        self._pending = None
+        self._sources.append(source)
+        rowset_stats['rows_by_file'][filename] = len(rows)
+
+    def load_directory(self, dirname, skip_balance_check=False, jobs=1,
+                       cache=None):
         """Given the pathname to a directory, load all the relevant files found
+
+        If jobs is not one, the files are parsed in parallel using that many
+        worker processes (or one per cpu, if jobs is zero or None).  The
+        balance checks are still done here, in filename order.
+
+        The files loaded are remembered, so that reload() can check them
+        for changes.
         """
 
         # which files are relevant
         pattern = "*.txt"
 
         # sort the list so that we always load with matching balances
+        dirname = os.path.normpath(dirname)
         files = sorted(glob.glob(os.path.join(dirname, pattern)))
 
-        for filename in files:
-            self.load_file(filename, skip_balance_check)
+        self._directories.append((dirname, skip_balance_check))
+
+        # Find what the files are before reading them, so any later
+        # change will be noticed
+        stats = [_file_stat(f) for f in files]
+
+        if jobs == 1 or len(files) < 2:
+            for filename, stat in zip(files, stats):
+                digest, rows = _parse_file(filename, cache)
+                self._load_source(filename, stat, digest, rows,
+                                  skip_balance_check)
+            return
+
+        # Only imported when needed, as it is slow to import
+        import multiprocessing
+
+        with multiprocessing.Pool(jobs or None) as pool:
+            # imap returns the results in order, so we can check each file
+            # while the later ones are still being parsed
+            parsed = pool.imap(functools.partial(_parse_file, cache=cache),
+                               files)
+            for filename, stat, (digest, rows) in zip(files, stats, parsed):
+                self._load_source(filename, stat, digest, rows,
+                                  skip_balance_check)
+
+    def reload(self, cache=None):
+        """Load again any files in the directories given to load_directory()
+        that have been changed, added or removed, and return their names.
+
+        Only the changed files are parsed again.  All the rows from the
+        first changed file onward are then added again, so the balance
+        checks are redone from that point.  Any rows that were added by
+        other means after that point are lost.
+
+        If a balance check fails, the rows up to that file are kept and the
+        next reload() will try again from there.
+        """
+        known = {source.filename: source for source in self._sources}
+
+        files = []
+        for dirname, skip_balance_check in self._directories:
+            for filename in sorted(glob.glob(os.path.join(dirname, '*.txt'))):
+                files.append((filename, skip_balance_check))
+
+        # Find which files are different, without parsing them
+        changed = []
+        sources = []
+        for filename, skip_balance_check in files:
+            stat = _file_stat(filename)
+            source = known.pop(filename, None)
+            if source is not None and source.stat != stat:
+                # The contents might still be the same (eg: a touch)
+                if _file_digest(filename) == source.digest:
+                    source.stat = stat
+                else:
+                    source = None
+            if source is None:
+                changed.append(filename)
+            sources.append(source)
+
+        # Any left over have been removed
+        changed.extend(sorted(known.keys()))
+
+        # The first file that is not the one previously loaded at the same
+        # place is where the reloading starts
+        first = 0
+        while (first < len(sources) and first < len(self._sources)
+               and sources[first] is self._sources[first]):
+            first += 1
+
+        if first < len(self._sources):
+            restart = self._sources[first]
+        else:
+            # Perhaps a failed reload left a file partly loaded
+            restart = self._pending
+
+        if restart is None and first == len(sources):
+            return changed
+
+        if restart is not None:
+            self._truncate(restart.start, restart.state)
+        self._pending = None
+        del self._sources[first:]
+
+        for (filename, skip_balance_check), source in zip(files[first:],
+                                                          sources[first:]):
+            if source is None:
+                stat = _file_stat(filename)
+                digest, rows = _parse_file(filename, cache)
+            else:
+                stat = source.stat
+                digest = source.digest
+                rows = source.rows
+            self._load_source(filename, stat, digest, rows, skip_balance_check)
+
+        return changed
+
+    def loaded_from(self, dirname):
+        """Return a new RowSet with just the rows that load_directory() loaded
+        from the given directory
+        """
+        dirname = os.path.normpath(dirname)
+        result = self._new()
+        for source in self._sources:
+            if os.path.dirname(source.filename) == dirname:
+                result.append(source.rows)
+        return result
 
     def filter(self, filter_strings):
         """Apply the given list of human readable filters to the rows
@@ -161,90 +631,149 @@ class RowSet(object):
         if filter_strings is None:
             filter_strings = []
 
-        result = RowSet()
-        for row in self.rows:
-            match = True
-            for s in filter_strings:
-                if not row.filter(s):
-                    match = False
-                    break
-            if match:
-                result.append(row)
+        # Each filter string is only parsed once, not once per row
+        filters = [Filter.compile(s) for s in filter_strings]
+
+        rows = self.rows
+        if filters and self._index_fields:
+            # Only the first filter sees every row, so only it can safely
+            # be answered from an index
+            positions = None
+            index = self._index(filters[0].field)
+            if index is not None:
+                positions = index.lookup(filters[0])
+
+            if positions is None:
+                index_stats['misses'] += 1
+            else:
+                index_stats['hits'] += 1
+                rows = [self.rows[i] for i in positions]
+                filters = filters[1:]
+
+        result = self._new()
+        result.append(_filtered(rows, filters))
+        rowset_stats['filter_rowsets'] += 1
         return result
 
-    def filter_forecast(self):
-        """Attempt to remove forecast lines that have a matching actual line"""
+    def filter_forecast(self, keep_order=False):
+        """Attempt to remove forecast lines that have a matching actual line
+
+        Normally the result is grouped into the month and tag buckets used
+        for the matching, but with keep_order the remaining rows are kept
+        in their original order.
+        """
         # We define buckets of transactions with same month and same tag.
         # If there is exactly one forecast and one or more actual tranactions
         # we assume the forecast hae been met and remove it.
-        # We then do an exhaustive search for forecast and actual items that
-        # have exactly matching values - and again the forecast is considered
-        # met and removed.
+        # We then search for forecast and actual items that have exactly
+        # matching values - and again the forecast is considered met and
+        # removed.
         #
         # TODO:
         # - The above definition does not cover all use cases
         #   E.G: multiple members donate small amounts each month, but they
         #   are all considered in the one tag
         # - Could conceivably want a different bucket definition
-        # - The original ordering of the rowset is completely destroyed
         # - Since this destroys data, there should be a way to stop it from
         #   running twice on the same data
-        # - The exhaustive search can be quite expensive
-
-        result = RowSet()
-        for month in self.group_by('month').values():
-            for tag in month.group_by('hashtag').values():
-
-                if not tag.isforecast:
-                    # There are no forecast items, dont filter
-                    result.append(list(tag))
-                    continue
-
-                split = tag.group_by('isforecast')
-
-                if False not in split:
-                    # There are no real items, dont filter
-                    result.append(list(tag))
-                    continue
-
-                # TODO:
-                # - could make the RowSet more list() like and avoid
-                #   the type conversion here
-                #   (needs to support del, and append(RowSet))
-                forecasts = list(split[True])
-                actuals = list(split[False])
-
-                if len(forecasts) == 1 and len(actuals) >= 1:
-                    # Only one forecast entry:
-                    # take only the real entry(s)
-                    result.append(actuals)
-                    continue
-
-                # There is more than one forecast item, try to match
-                # them with the real items
-                for forecast in forecasts:
-                    found = False
-                    for actualidx in range(len(actuals)):
-                        if forecast.value == actuals[actualidx].value:
-                            found = True
-                            result.append(actuals[actualidx])
-                            del actuals[actualidx]
-                            break
-                    if not found:
-                        # No matching real, take the forecast
-                        result.append(forecast)
-
-                # keep any unmatched real items
-                result.append(actuals)
 
+        # Find the bucket for each row in one pass, keeping the buckets in
+        # the same order that group_by('month') and group_by('hashtag')
+        # would give them
+        buckets = {}
+        for position, row in enumerate(self.rows):
+            if row.date is None:
+                # If we have no date, then we cannot be grouped by that!
+                continue
+
+            tag = row.hashtag
+            if tag is None:
+                tag = 'unknown'
+
+            buckets.setdefault(row.month, {}).setdefault(tag, []).append(
+                position
+            )
+
+        kept = []
+        for month in buckets.values():
+            for positions in month.values():
+                kept.extend(self._filter_forecast_bucket(positions))
+
+        if keep_order:
+            kept.sort()
+
+        result = self._new()
+        result.append([self.rows[i] for i in kept])
         return result
 
-    def autosplit(self):
-        """look at the split bangtag and return the rowset all split
+    def _filter_forecast_bucket(self, positions):
+        """Return the positions of the rows to keep from one bucket
+        """
+        forecasts = []
+        actuals = []
+        for position in positions:
+            if self.rows[position].isforecast:
+                forecasts.append(position)
+            else:
+                actuals.append(position)
+
+        if not forecasts or not actuals:
+            # There are no forecast items or no real items, dont filter
+            return positions
+
+        if len(forecasts) == 1:
+            # Only one forecast entry:
+            # take only the real entry(s)
+            return actuals
+
+        # There is more than one forecast item, try to match each one with
+        # the first unused real item of the same value
+        unused = {}
+        for position in actuals:
+            value = self.rows[position].value
+            unused.setdefault(value, collections.deque()).append(position)
+
+        kept = []
+        matched = set()
+        for position in forecasts:
+            candidates = unused.get(self.rows[position].value)
+            if candidates:
+                actual = candidates.popleft()
+                matched.add(actual)
+                kept.append(actual)
+            else:
+                # No matching real, take the forecast
+                kept.append(position)
+
+        # keep any unmatched real items
+        kept.extend(i for i in actuals if i not in matched)
+        return kept
+
+    def iter_autosplit(self, window=None):
+        """Generate the rows with the split bangtags all split, creating
+        the children of each row only as they are needed.
+
+        If a (start, end) window of dates is given (either may be None),
+        repeating forecasts only get children for the months overlapping it
         """
-        result = RowSet()
         for row in self:
-            result.append(row.autosplit())
+            yield from row.autosplit(window=window)
+
+    def autosplit(self, filter_strings=None, window=None):
+        """look at the split bangtag and return the rowset all split
+
+        If filters are given, only the split rows that match them are kept.
+        This gives the same result as autosplit().filter(filter_strings),
+        but without ever holding all the split rows at once.
+        """
+        rows = self.iter_autosplit(window)
+        if filter_strings:
+            filters = [Filter.compile(s) for s in filter_strings]
+            rows = _filtered(rows, filters)
+            rowset_stats['filter_rowsets'] += 1
+
+        result = self._new()
+        result.append(rows)
         return result
 
     def _split_locn_xfer(self):
@@ -254,15 +783,45 @@ class RowSet(object):
         # - this could be cleaner, it is essentially breaking the promise of
         #   "auto" in the autosplit() above
 
-        result = RowSet()
+        result = self._new()
         for row in self:
             result.append(row._split_locn_xfer())
         return result
 
     def group_by(self, field):
         """Group the rowset by the given row field and return groups as a dict
+
+        The results for the most recently used fields are remembered until
+        the next append, so grouping the same RowSet again is cheap.  The
+        groups in the result are shared between the calls and should not
+        be changed.
+        """
+        memo = self._group_by_memo
+        result = memo.get(field)
+        if result is not None:
+            group_by_stats['hits'] += 1
+            memo.move_to_end(field)
+            return dict(result)
+
+        group_by_stats['misses'] += 1
+        result = self._group_by(field)
+        rowset_stats['group_by_rowsets'] += len(result)
+
+        memo[field] = result
+        while len(memo) > self.group_by_memo_size:
+            memo.popitem(last=False)
+        return dict(result)
+
+    def _group_by(self, field):
+        """Do the actual grouping for group_by
         """
-        # This could be cached for performance, but for clarity it is not
+        index = self._index(field)
+        if index is not None and _MISSING not in index.positions:
+            index_stats['hits'] += 1
+            return self._group_by_index(field, index)
+        if self._index_fields:
+            index_stats['misses'] += 1
+
         result = {}
         for row in self:
             if field == 'month':
@@ -276,16 +835,128 @@ class RowSet(object):
                 key = 'unknown'
 
             if key not in result:
-                result[key] = RowSet()
+                result[key] = self._new()
 
             result[key].append(row)
         return result
 
-    def grid_by(self, field_x, field_y):
+    def _group_by_index(self, field, index):
+        """The group_by, answered using the index on the field
+        """
+        groups = {}
+        for key, positions in index.positions.items():
+            if key is None:
+                if field == 'month':
+                    # If we have no date, then we cannot be grouped by that!
+                    continue
+                key = 'unknown'
+            groups.setdefault(key, []).append(positions)
+
+        result = {}
+        for key, positions in groups.items():
+            if len(positions) > 1:
+                positions = sorted(sum(positions, []))
+            else:
+                positions = positions[0]
+            result[key] = self._new()
+            result[key].append([self.rows[i] for i in positions])
+        return result
+
+    def _bucket_totals(self, field):
+        """Total the rows for each value of the field (or for each key
+        returned by the field, if it is a function) in one pass.
+
+        Returns the sorted list of keys and the matching lists of the
+        totals and forecast flags
+        """
+        if callable(field):
+            keyfn = field
+        else:
+            def keyfn(row):
+                return getattr(row, field)
+
+        totals = {}
+        forecast = {}
+        for row in self:
+            key = keyfn(row)
+            totals[key] = totals.get(key, 0) + row.value
+            if row.isforecast:
+                forecast[key] = True
+
+        keys = sorted(totals.keys(), key=_sort_key)
+        return (
+            keys,
+            [totals[key] for key in keys],
+            [forecast.get(key, False) for key in keys]
+        )
+
+    def _prefix_balances(self, field):
+        """Return the sorted keys found for the field and a function that
+        gives the Balance of all the rows before the given position in
+        that list of keys
+        """
+        found, totals, forecasts = self._bucket_totals(field)
+
+        # prefix sums of the totals and the forecast taint
+        balances = [(decimal.Decimal(0), False)]
+        balance = decimal.Decimal(0)
+        isforecast = False
+        for total, forecast in zip(totals, forecasts):
+            balance += total
+            isforecast = isforecast or forecast
+            balances.append((balance, isforecast))
+
+        def balance_before(i):
+            return Balance(*balances[i])
+
+        return [_sort_key(key) for key in found], balance_before
+
+    def running_balance(self, field, keys=None):
+        """Return the running balance of the rows, as a dict of key ->
+        Balance, where each Balance is the total of all the rows with a
+        field value at or before that key - the same as the value of
+        filter(['field<=key']), but without a rescan for every key.
+
+        The field can also be a function returning the bucket for a row.
+        If a list of keys is given, the result has exactly those keys,
+        otherwise it has every key found in the rows, in sorted order.
+        """
+        sort_keys, balance_before = self._prefix_balances(field)
+        if keys is None:
+            keys = [key for _, key in sort_keys]
+
+        result = {}
+        for key in keys:
+            i = bisect.bisect_right(sort_keys, _sort_key(key))
+            result[key] = balance_before(i)
+        return result
+
+    def period_balances(self, field, keys=None):
+        """Return the opening and closing balances of each period, as a
+        dict of key -> Period.  The opening Balance totals all the rows
+        with a field value before the key (like filter(['field<key'])) and
+        the closing Balance also includes the rows in the period itself.
+
+        The field and keys are used in the same way as for running_balance
+        """
+        sort_keys, balance_before = self._prefix_balances(field)
+        if keys is None:
+            keys = [key for _, key in sort_keys]
+
+        result = {}
+        for key in keys:
+            sort_key = _sort_key(key)
+            result[key] = Period(
+                balance_before(bisect.bisect_left(sort_keys, sort_key)),
+                balance_before(bisect.bisect_right(sort_keys, sort_key)),
+            )
+        return result
+
+    def grid_by(self, field_x, field_y, keep_rows=False):
         """Group the rowset into a grid by the given two fields and return
         a grid object"""
 
-        grid = RowGrid()
+        grid = RowGrid(keep_rows)
         grid.load_RowSet(field_x, field_y, self)
 
         return grid
@@ -293,23 +964,51 @@ class RowSet(object):
     def last(self):
         """Return the chronologically last row from the rowset
         """
+        if self._last_row is not None:
+            return self._last_row
+
+        # There are no dated rows, so let max() give the error
         def keyfn(row):
             return row.date
 
         return max(self, key=keyfn)
 
 
+def _add_total(totals, key, row):
+    """Add the row into the [value, isforecast] total for the key"""
+    total = totals.get(key)
+    if total is None:
+        totals[key] = [decimal.Decimal(0) + row.value, row.isforecast]
+    else:
+        total[0] += row.value
+        if row.isforecast:
+            total[1] = True
+
+
 class RowGrid(object):
-    """Contain a grid of rows.  E.G: grouped by both category and month"""
+    """Contain a grid of rows.  E.G: grouped by both category and month
 
-    def __init__(self):
-        self.original_rows = []
+    Each cell, and each heading in the x and y directions, holds the
+    Balance of its rows.  If keep_rows is set, they instead hold a
+    RowSet with all the rows.
+    """
+
+    def __init__(self, keep_rows=False):
+        self.keep_rows = keep_rows
         self.field_x = None
         self.field_y = None
         self._headings_x = {}
+        self._headings_y = {}
         self.rows = {}
         self.isforecast = False
 
+        self._totals_x = {}
+        self._totals_y = {}
+        self._totals = {}
+        self._sorted_x = None
+        self._sorted_y = None
+        self._width_y = None
+
     def _add_row(self, row):
         """Add a single row entry into the grid"""
 
@@ -322,11 +1021,25 @@ class RowGrid(object):
         if value_y is None:
             value_y = 'unknown'
 
+        if row.isforecast:
+            self.isforecast = True
+
+        if not self.keep_rows:
+            _add_total(self._totals_x, value_x, row)
+            _add_total(self._totals_y, value_y, row)
+            if value_y not in self._totals:
+                self._totals[value_y] = {}
+            _add_total(self._totals[value_y], value_x, row)
+            return
+
         if value_x not in self._headings_x:
             self._headings_x[value_x] = RowSet()
-
         self._headings_x[value_x].append(row)
 
+        if value_y not in self._headings_y:
+            self._headings_y[value_y] = RowSet()
+        self._headings_y[value_y].append(row)
+
         # TODO: should there be a RowSetDict as well as the current RowSet
         #       array?
         if value_y not in self.rows:
@@ -336,9 +1049,6 @@ class RowGrid(object):
 
         self.rows[value_y][value_x].append(row)
 
-        if row.isforecast:
-            self.isforecast = True
-
     def load_RowSet(self, field_x, field_y, rowset):
         """Load a RowSet into the grid"""
         self.field_x = field_x
@@ -347,6 +1057,23 @@ class RowGrid(object):
         for row in rowset:
             self._add_row(row)
 
+        if not self.keep_rows:
+            # Turn the running totals into the grid contents
+            self._headings_x = {
+                x: Balance(*total) for x, total in self._totals_x.items()
+            }
+            self._headings_y = {
+                y: Balance(*total) for y, total in self._totals_y.items()
+            }
+            self.rows = {
+                y: {x: Balance(*total) for x, total in cells.items()}
+                for y, cells in self._totals.items()
+            }
+
+        self._sorted_x = None
+        self._sorted_y = None
+        self._width_y = None
+
     @property
     def headings_x(self):
         """Return the key for each of the headings in the x direction"""
@@ -357,13 +1084,28 @@ class RowGrid(object):
     def headings_y(self):
         return self.rows.keys()
 
+    @property
+    def headings_x_sorted(self):
+        """The headings in the x direction, as a sorted list"""
+        if self._sorted_x is None:
+            self._sorted_x = sorted(self.headings_x)
+        return self._sorted_x
+
+    @property
+    def headings_y_sorted(self):
+        """The headings in the y direction, as a sorted list"""
+        if self._sorted_y is None:
+            self._sorted_y = sorted(self.headings_y)
+        return self._sorted_y
+
     @property
     def headings_y_width(self):
         """How wide do we need to make a column to fit all the y headings?
         mostly intended as a helper for jinja templates.
         """
-
-        return max([len(i) for i in self.headings_y])
+        if self._width_y is None:
+            self._width_y = max([len(i) for i in self.headings_y])
+        return self._width_y
 
     def headings_x_format(self, method, arg):
         """Return a list of strings generated with the given method name
@@ -0,0 +1,103 @@
+# Licensed under GPLv3
+import os
+import re
+
+
+# The data file with the list of valid tags, stored next to this module
+DEFAULT_FILENAME = os.path.join(
+    os.path.dirname(os.path.abspath(__file__)),
+    'tags.txt'
+)
+
+# Overall counts of the work done checking tags
+tagschema_stats = {
+    'regex_compilations': 0,
+}
+
+# Map the names used in the data file onto the tag prefix chars
+_TYPES = {
+    'hashtag': '#',
+    'bangtag': '!',
+}
+
+
+class TagSchema(object):
+    """The list of valid tag patterns, compiled into a single matcher for
+    each type of tag
+    """
+
+    def __init__(self):
+        self.patterns = {x: [] for x in _TYPES.values()}
+        self._matchers = {}
+        self._verdicts = {}
+
+    def add(self, x, pattern):
+        """Add one more valid pattern for the tag type x
+        """
+        if x not in self.patterns:
+            raise ValueError("Unknown tag type {}".format(x))
+
+        self.patterns[x].append(pattern)
+
+        # any earlier compiled results are now out of date
+        self._matchers.pop(x, None)
+        self._verdicts.clear()
+
+    def load_file(self, stream):
+        """Given an open file handle (or a filename), add all the patterns
+        """
+        if isinstance(stream, str):
+            with open(stream, 'r') as f:
+                return self.load_file(f)
+
+        for line in stream:
+            line = line.strip()
+            if not line or line[0] == '#':
+                continue
+
+            (name, pattern) = line.split(None, maxsplit=1)
+            if name not in _TYPES:
+                raise ValueError("Unknown tag type name {}".format(name))
+
+            self.add(_TYPES[name], pattern)
+
+    def _matcher(self, x):
+        """Return the compiled regex that matches all valid tags of type x
+        """
+        matcher = self._matchers.get(x)
+        if matcher is None:
+            items = ['(?:' + i + ')' for i in self.patterns[x]]
+            matcher = re.compile('|'.join(items))
+            tagschema_stats['regex_compilations'] += 1
+            self._matchers[x] = matcher
+        return matcher
+
+    def validate(self, x, tag):
+        """Check the tag against valid tag names, raise an error if it is
+        not valid
+        """
+        verdict = self._verdicts.get((x, tag))
+        if verdict is None:
+            if x not in self.patterns:
+                raise ValueError("Unknown tag type {}".format(x))
+
+            verdict = self._matcher(x).fullmatch(tag) is not None
+            self._verdicts[(x, tag)] = verdict
+
+        if not verdict:
+            raise ValueError("Unknown tag {}{}".format(x, tag))
+
+
+_default = None
+
+
+def default():
+    """Return the schema loaded from the default data file, loading it on
+    the first use
+    """
+    global _default
+    if _default is None:
+        schema = TagSchema()
+        schema.load_file(DEFAULT_FILENAME)
+        _default = schema
+    return _default
@@ -0,0 +1,145 @@
+""" Perform tests on the columnar.py
+"""
+
+import unittest
+import decimal
+import sys
+import os
+
+from datetime import date as Date
+from io import StringIO
+from unittest import mock
+
+# Ensure that we look for any modules in our local lib dir.  This allows simple
+# testing and development use.  It also does not break the case where the lib
+# has been installed properly on the normal sys.path
+sys.path.insert(0,
+                os.path.join(os.path.dirname(os.path.abspath(__file__)), 'lib')
+                )
+# I would use site.addsitedir, but it does an append, not insert
+
+import columnar # noqa
+import rowset # noqa
+import row # noqa
+
+
+@unittest.skipIf(columnar.numpy is None, 'numpy is not installed')
+class TestColumnarRowSet(unittest.TestCase):
+    input_data = """
+#balance 0 Opening Balance
+-10 1970-02-06 comment4
+10.5 1970-01-05 comment1
+-10 1970-01-10 comment2 #bills:rent
+-10.05 1970-01-01 comment3 #bills:water !locn:test_location
+-10 1970-03-01 comment5 #bills:rent !forecast
+-15 1970-01-11 comment6 #bills:water !months:3
+#balance -44.55
+"""
+
+    def setUp(self):
+        self.rows = rowset.RowSet()
+        self.rows.load_file(StringIO(self.input_data))
+        self.columnar = columnar.ColumnarRowSet()
+        self.columnar.load_file(StringIO(self.input_data))
+
+    def tearDown(self):
+        self.rows = None
+        self.columnar = None
+
+    def test_value(self):
+        self.assertEqual(str(self.columnar.value), '-44.55')
+        self.assertEqual(str(columnar.ColumnarRowSet().value), '0')
+
+        self.columnar.append(row.RowData("0.45", Date(1970, 3, 2), "a"))
+        self.assertEqual(str(self.columnar.value), '-44.10')
+        self.columnar.append(row.RowData("0.1", Date(1970, 3, 2), "a"))
+        self.assertEqual(str(self.columnar.value), '-44')
+
+    def test_value_fake(self):
+        """Rows without a value in cents still sum"""
+        fake = row.Row()
+        fake.value = decimal.Decimal(1) / 3
+        self.columnar.append(fake)
+        self.rows.append(fake)
+        self.assertEqual(self.columnar.value, self.rows.value)
+
+        filters = ['value>-11']
+        self.assertEqual(self.columnar.filter(filters).value,
+                         self.rows.filter(filters).value)
+
+    def test_totals(self):
+        """The totals of each result come from the numpy arrays"""
+        for filters in ([], ['isdata==1'], ['value<0'], ['value>-10.05'],
+                        ['value>100']):
+            with mock.patch.object(columnar.ColumnarRowSet,
+                                   '_add_one_value') as add:
+                got = self.columnar.filter(filters)
+                add.assert_not_called()
+
+            expected = self.rows.filter(filters)
+            self.assertEqual(str(got.balance), str(expected.balance))
+            self.assertEqual(got.isforecast, expected.isforecast)
+            self.assertEqual(got.first_date, expected.first_date)
+            self.assertEqual(got.last_date, expected.last_date)
+            if len(expected):
+                self.assertEqual(str(got.last()), str(expected.last()))
+
+    def test_filter(self):
+        for filters in (
+                ['isdata==1'],
+                ['value<0', 'month==1970-01'],
+                ['hashtag=~^bills:', 'isforecast==0'],
+                ['hashtag!~water'],
+                ['location==test_location'],
+                ['value>-10.05'],
+                [],
+        ):
+            got = self.columnar.filter(filters)
+            self.assertIsInstance(got, columnar.ColumnarRowSet)
+            self.assertEqual(str(got), str(self.rows.filter(filters)))
+            self.assertEqual(got.value, self.rows.filter(filters).value)
+            self.assertEqual(got.isforecast,
+                             self.rows.filter(filters).isforecast)
+
+    def test_filter_chain(self):
+        """The columns are carried over into the results"""
+        got = self.columnar.filter(['isdata==1'])
+        self.assertIn('isdata', got._columns)
+
+        got = got.filter(['month<=1970-01'])
+        self.assertEqual(
+            str(got),
+            str(self.rows.filter(['isdata==1', 'month<=1970-01']))
+        )
+
+    def test_filter_errors(self):
+        with self.assertRaises(ValueError):
+            self.columnar.filter(['nooperator'])
+        with self.assertRaises(AttributeError):
+            self.columnar.filter(['flubber==1'])
+
+    def test_group_by(self):
+        for field in ('month', 'hashtag', 'location', 'isforecast'):
+            got = self.columnar.group_by(field)
+            expected = self.rows.group_by(field)
+
+            self.assertEqual(list(got.keys()), list(expected.keys()))
+            for key in expected:
+                self.assertEqual(str(got[key]), str(expected[key]))
+
+    def test_filter_forecast(self):
+        self.assertEqual(
+            str(self.columnar.filter_forecast()),
+            str(self.rows.filter_forecast())
+        )
+
+    def test_autosplit(self):
+        got = self.columnar.autosplit()
+        self.assertIsInstance(got, columnar.ColumnarRowSet)
+        self.assertEqual(str(got), str(self.rows.autosplit()))
+
+    def test_from_rowset(self):
+        got = columnar.ColumnarRowSet.from_rowset(self.rows)
+        self.assertIsInstance(got, columnar.ColumnarRowSet)
+        self.assertEqual(got.rows, self.rows.rows)
+        self.assertEqual(got.value, self.rows.value)
@@ -0,0 +1,109 @@
+""" Perform tests on the ledger.py
+"""
+
+import unittest
+import tempfile
+import sys
+import os
+
+from unittest import mock
+
+# Ensure that we look for any modules in our local lib dir.  This allows simple
+# testing and development use.  It also does not break the case where the lib
+# has been installed properly on the normal sys.path
+sys.path.insert(0,
+                os.path.join(os.path.dirname(os.path.abspath(__file__)), 'lib')
+                )
+# I would use site.addsitedir, but it does an append, not insert
+
+import ledger # noqa
+import rowset # noqa
+
+
+class TestLedger(unittest.TestCase):
+    files = {
+        '1970-01.txt': """#balance 0 Opening Balance
+10 1970-01-05 comment1
+-10 1970-01-10 comment2 #bills:rent !months:2
+""",
+        '1970-02.txt': """#balance 0
+5 1970-02-05 comment3
+""",
+        'future/1970-03.txt': """-5 1970-03-01 comment4 !forecast
+""",
+    }
+
+    def setUp(self):
+        self.dir = tempfile.TemporaryDirectory()
+        os.mkdir(os.path.join(self.dir.name, 'future'))
+        for name, content in self.files.items():
+            self.write(name, content)
+        self.ledger = ledger.Ledger(self.dir.name)
+
+    def tearDown(self):
+        self.dir.cleanup()
+
+    def write(self, name, content):
+        filename = os.path.join(self.dir.name, name)
+        with open(filename, 'w') as f:
+            f.write(content)
+
+        # Make sure that the change is seen, however coarse the clock
+        stat = os.stat(filename)
+        os.utime(filename, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1000))
+
+    def expected(self, includefuture=False):
+        rows = rowset.RowSet()
+        rows.load_directory(self.dir.name)
+        if includefuture:
+            rows.load_directory(os.path.join(self.dir.name, 'future'),
+                                skip_balance_check=True)
+        return rows
+
+    def test_rows(self):
+        self.assertEqual(str(self.ledger.rows(split=False)),
+                         str(self.expected()))
+        self.assertEqual(str(self.ledger.rows()),
+                         str(self.expected().autosplit()))
+        self.assertEqual(str(self.ledger.rows(includefuture=True)),
+                         str(self.expected(True).autosplit()))
+
+        # The main rows do not change when the future ones are loaded
+        self.assertEqual(str(self.ledger.rows(split=False)),
+                         str(self.expected()))
+
+    def test_rows_reused(self):
+        rows = self.ledger.rows()
+        self.assertIs(self.ledger.rows(), rows)
+        self.assertIsNot(self.ledger.rows(split=False), rows)
+
+        filtered = self.ledger.rows(filter_strings=['value>0'])
+        self.assertEqual(str(filtered),
+                         str(self.expected().autosplit(['value>0'])))
+
+    def test_refresh(self):
+        self.ledger.rows(includefuture=True)
+        self.assertEqual(self.ledger.refresh(), [])
+
+        self.write('1970-02.txt', """#balance 0
+6 1970-02-05 comment3
+""")
+        with mock.patch('rowset._parse_file',
+                        wraps=rowset._parse_file) as parse:
+            self.assertEqual(
+                self.ledger.refresh(),
+                [os.path.join(self.dir.name, '1970-02.txt')]
+            )
+            self.assertEqual(parse.call_count, 1)
+
+        self.assertEqual(str(self.ledger.rows()),
+                         str(self.expected().autosplit()))
+        self.assertEqual(str(self.ledger.rows(includefuture=True)),
+                         str(self.expected(True).autosplit()))
+
+    def test_refresh_error(self):
+        self.ledger.rows()
+        self.write('1970-02.txt', """#balance 1
+""")
+        with self.assertRaises(ValueError):
+            self.ledger.refresh()
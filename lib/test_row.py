@@ -212,10 +212,79 @@ class TestRowClass(unittest.TestCase):
         self.assertEqual(obj.filter('rel_months<-264'), obj)
         self.assertEqual(obj.filter('rel_months<-265'), None)
 
+    def test_asof(self):
+        obj = self.rows[2]
+        row.set_asof(Date(1990, 5, 4))
+        try:
+            self.assertEqual(row.asof(), Date(1990, 5, 4))
+            self.assertEqual(obj.rel_months, -265)
+        finally:
+            self.assertEqual(row.set_asof(None), Date(1990, 5, 4))
+
+    def test_month_shared(self):
+        self.assertIs(self.rows[0].month, self.rows[1].month)
+
+        self.rows[0].date = Date(1970, 4, 10)
+        self.assertIs(self.rows[0].month, self.rows[3].month)
+        self.assertEqual(self.rows[0].taxyearhk, 'ye1971')
+
     def test_str(self):
         self.assertEqual(str(self.rows[4]), "100 1972-02-29 !months:-1:5")
 
 
+class TestFilterClass(unittest.TestCase):
+    def test_parse(self):
+        f = row.Filter('value>=10')
+        self.assertEqual(f.field, 'value')
+        self.assertEqual(f.op, '>=')
+        self.assertEqual(f.value, 10.0)
+        self.assertEqual(repr(f), "Filter('value>=10')")
+
+        f = row.Filter('month<=1970-01')
+        self.assertEqual(f.value, '1970-01')
+
+        with self.assertRaises(ValueError):
+            row.Filter('direction<>value')
+        with self.assertRaises(ValueError):
+            row.Filter('nooperator')
+
+    def test_compile(self):
+        f = row.Filter.compile('hashtag=~^dues:')
+        self.assertIs(row.Filter.compile('hashtag=~^dues:'), f)
+        self.assertIs(row.Filter.compile(f), f)
+
+    def test_test(self):
+        self.assertTrue(row.Filter('value>9.5').test(10))
+        self.assertFalse(row.Filter('value>9.5').test(None))
+        self.assertTrue(row.Filter('hashtag!~foo').test(None))
+        self.assertTrue(row.Filter('hashtag=~^NO').test(None))
+        self.assertTrue(row.Filter('month==1970-01').test('1970-01-01'))
+
+    def test_match(self):
+        obj = row.RowData(10, Date(1970, 10, 20), "#test_hashtag")
+        self.assertTrue(row.Filter('hashtag==test_hashtag').match(obj))
+        self.assertFalse(row.Filter('direction==outgoing').match(obj))
+
+    def test_stats(self):
+        stats = dict(row.row_stats)
+        f = row.Filter('comment=~stats')
+        obj = row.RowData(10, Date(1970, 10, 20), "stats #test_hashtag")
+        f.match(obj)
+        obj.filter('value>0')
+        self.assertEqual(row.row_stats['regex_compilations'],
+                         stats['regex_compilations'] + 1)
+        self.assertEqual(row.row_stats['filter_evaluations'],
+                         stats['filter_evaluations'] + 2)
+        self.assertEqual(row.row_stats['tag_validations'],
+                         stats['tag_validations'] + 1)
+
+        obj = row.RowData(10, Date(1970, 10, 20), "!months:3")
+        stats = dict(row.row_stats)
+        self.assertEqual(len(obj.autosplit()), 3)
+        self.assertEqual(row.row_stats['autosplit_children'],
+                         stats['autosplit_children'] + 3)
+
+
 class TestRowPragmaClass(unittest.TestCase):
     def test_balance(self):
         input_data = "#balance 10 The Comment"
@@ -247,6 +316,29 @@ class TestRowDataClass(unittest.TestCase):
         with self.assertRaises(ValueError):
             row.RowData(10, 'notadate', "A Comment")
 
+    def test_value(self):
+        """Values keep the number of decimal places they were given"""
+        for value in ('10', '-0.5', '8.10', '-29.65', '0'):
+            obj = row.RowData(value, Date(1970, 10, 20), "A Comment")
+            self.assertEqual(str(obj.value), value)
+
+        obj.value = 12
+        self.assertEqual(obj.value, 12)
+
+        with self.assertRaises(ValueError):
+            row.RowData('0.001', Date(1970, 10, 20), "A Comment")
+        with self.assertRaises(ValueError):
+            row.RowData('NaN', Date(1970, 10, 20), "A Comment")
+
+    def test_slots(self):
+        obj = row.RowData(10, Date(1970, 10, 20), "A Comment")
+        with self.assertRaises(AttributeError):
+            obj.flubber = 1
+
+        # and every slot it has is used
+        self.assertEqual(sorted(obj.__getstate__()),
+                         sorted(name for name, _ in obj._slots()))
+
     def test_forecast_simple(self):
         obj = row.RowData(10, Date(1970, 10, 21), "A Comment !forecast")
         self.assertEqual(obj.isforecast, True)
@@ -264,3 +356,50 @@ class TestRowDataClass(unittest.TestCase):
 
         self.assertEqual(str(rows[0]), '-300 1970-10-23 #test_hashtag !locn_xfer:test_location:test_location2:300 !locn:test_location')  # noqa
         self.assertEqual(str(rows[1]), '300 1970-10-23 #test_hashtag !locn_xfer:test_location:test_location2:300 !locn:test_location2')  # noqa
+        self.assertEqual(rows[1].location, 'test_location2')
+        self.assertEqual(rows[1].bangtags['child'], ['locn_xfer'])
+
+        obj = row.RowData(0, Date(1970, 10, 23), "!locn_xfer:test_location:nowhere:300")  # noqa
+        with self.assertRaises(ValueError):
+            obj._split_locn_xfer()
+
+    def test_comment_cache(self):
+        obj = row.RowData(10, Date(1970, 10, 20), "A #test_hashtag !test_bangtag2:a")  # noqa
+        self.assertEqual(obj.comment, "A #test_hashtag !test_bangtag2:a")
+        self.assertIs(obj.comment, obj.comment)
+
+        obj.hashtag = 'test_hashtag2'
+        self.assertEqual(obj.comment, "A #test_hashtag2 !test_bangtag2:a")
+
+        obj.bangtags = {'test_bangtag2': ['b']}
+        self.assertEqual(obj.comment, "A #test_hashtag2 !test_bangtag2:b")
+
+        # the bangtags can be changed in place
+        obj.bangtags['test_bangtag2'][0] = 'c'
+        self.assertEqual(obj.comment, "A #test_hashtag2 !test_bangtag2:c")
+        obj.bangtags['test_bangtag2'].append('d')
+        self.assertEqual(obj.comment, "A #test_hashtag2 !test_bangtag2:c:d")
+
+        obj.comment = "B !test_bangtag"
+        self.assertEqual(obj.comment, "B !test_bangtag")
+
+        # tags are replaced as plain text, not as a regex
+        obj = row.RowData(10, Date(1970, 10, 20), "C !test_bangtag2:a+b")
+        obj.bangtags = {'test_bangtag2': ['c']}
+        self.assertEqual(obj.comment, "C !test_bangtag2:c")
+
+    def test_autosplit_twice(self):
+        """Splitting does not change the parent row"""
+        obj = row.RowData(10, Date(1970, 10, 20), "#test_hashtag !forecast:monthly:until:1970-12-01")  # noqa
+        first = [str(x) for x in obj.autosplit()]
+        self.assertEqual(first, [str(x) for x in obj.autosplit()])
+        self.assertEqual(len(first), 2)
+        self.assertEqual(first[1], '10 1970-11-20 #test_hashtag !forecast:child:until:1970-12-01')  # noqa
+        self.assertEqual(str(obj), '10 1970-10-20 #test_hashtag !forecast:monthly:until:1970-12-01')  # noqa
+
+        # A child has its own bangtags
+        obj = row.RowData(10, Date(1970, 10, 20), "!locn:test_location !months:2")  # noqa
+        children = obj.autosplit()
+        children[0].bangtags['locn'][0] = 'test_location2'
+        self.assertEqual(children[1].location, 'test_location')
+        self.assertEqual(obj.comment, '!locn:test_location !months:2')
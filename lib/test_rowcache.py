@@ -0,0 +1,110 @@
+""" Perform tests on the rowcache.py
+"""
+
+import unittest
+import tempfile
+import time
+import sys
+import os
+
+from io import StringIO
+from unittest import mock
+
+# Ensure that we look for any modules in our local lib dir.  This allows simple
+# testing and development use.  It also does not break the case where the lib
+# has been installed properly on the normal sys.path
+sys.path.insert(0,
+                os.path.join(os.path.dirname(os.path.abspath(__file__)), 'lib')
+                )
+# I would use site.addsitedir, but it does an append, not insert
+
+import rowcache # noqa
+import rowset # noqa
+
+
+class TestRowCache(unittest.TestCase):
+    input_data = """#balance 0 Opening Balance
+10 1970-01-05 comment1
+-10 1970-01-10 comment2 #bills:rent !months:2
+"""
+
+    def setUp(self):
+        self.dir = tempfile.TemporaryDirectory()
+        self.cache = rowcache.RowCache(self.dir.name)
+
+    def tearDown(self):
+        self.dir.cleanup()
+
+    def test_cache_dir(self):
+        with mock.patch.dict(os.environ, {'XDG_CACHE_HOME': '/flubber'}):
+            self.assertEqual(
+                rowcache.cache_dir('rows'),
+                '/flubber/dsl-accounts/rows'
+            )
+
+    def test_miss(self):
+        self.assertEqual(self.cache.get(self.input_data), None)
+
+    def test_put_get(self):
+        self.cache.put(self.input_data, ['a', 'b'])
+        self.assertEqual(self.cache.get(self.input_data), ['a', 'b'])
+        self.assertEqual(self.cache.get(self.input_data + "\n"), None)
+
+    def test_broken_entry(self):
+        self.cache.put(self.input_data, ['a', 'b'])
+        with open(self.cache._filename(self.input_data), 'w') as f:
+            f.write('not a pickle')
+        self.assertEqual(self.cache.get(self.input_data), None)
+
+    def test_clear(self):
+        self.cache.put(self.input_data, ['a', 'b'])
+        self.cache.put(self.input_data + "\n", ['c'])
+        self.assertEqual(self.cache.clear(), 2)
+        self.assertEqual(self.cache.get(self.input_data), None)
+        self.assertEqual(self.cache.clear(), 0)
+
+    def test_load_file(self):
+        rows = rowset.RowSet()
+        rows.load_file(StringIO(self.input_data), cache=self.cache)
+        self.assertNotEqual(self.cache.get(self.input_data), None)
+
+        # The second load must not need to parse anything
+        with mock.patch('rowset._parse_lines') as parse:
+            cached = rowset.RowSet()
+            cached.load_file(StringIO(self.input_data), cache=self.cache)
+            parse.assert_not_called()
+
+        self.assertEqual(str(cached), str(rows))
+        self.assertEqual(str(cached.autosplit()), str(rows.autosplit()))
+        self.assertEqual(cached.value, 0)
+
+    def test_prune(self):
+        self.cache.put(self.input_data, ['a', 'b'])
+        old = self.cache._filename(self.input_data + "\n")
+        self.cache.put(self.input_data + "\n", ['c'])
+        other = os.path.join(self.dir.name, 'flubber-1234.pickle')
+        with open(other, 'w') as f:
+            f.write('from another code version')
+
+        # An entry not used for a long time is removed
+        then = time.time() - self.cache.max_age - 60
+        os.utime(old, (then, then))
+        self.assertEqual(self.cache.prune(), 2)
+        self.assertEqual(self.cache.get(self.input_data), ['a', 'b'])
+        self.assertFalse(os.path.exists(old))
+        self.assertFalse(os.path.exists(other))
+
+        # But using an entry keeps it
+        filename = self.cache._filename(self.input_data)
+        os.utime(filename, (then, then))
+        self.cache.get(self.input_data)
+        self.assertEqual(self.cache.prune(), 0)
+
+    def test_put_prunes(self):
+        other = os.path.join(self.dir.name, 'flubber-1234.pickle')
+        with open(other, 'w') as f:
+            f.write('from another code version')
+
+        self.cache.put(self.input_data, ['a', 'b'])
+        self.assertFalse(os.path.exists(other))
+        self.assertEqual(self.cache.get(self.input_data), ['a', 'b'])
@@ -7,6 +7,7 @@ import sys
 import os
 import decimal
 import datetime
+import tempfile
 
 from datetime import date as Date
 from io import StringIO
@@ -64,6 +65,40 @@ class TestRowSet(unittest.TestCase):
         self.rows.append(row.RowData("-0.5", Date(1970, 3,13), "comment10")) # noqa
         self.assertEqual(str(self.rows.value), '-46')
 
+    def test_aggregates(self):
+        self.assertEqual(self.rows.first_date, Date(1970, 1, 1))
+        self.assertEqual(self.rows.last_date, Date(1970, 3, 1))
+        self.assertEqual(self.rows.last().date, Date(1970, 3, 1))
+
+        empty = rowset.RowSet()
+        self.assertEqual(empty.first_date, None)
+        self.assertEqual(empty.last_date, None)
+        self.assertEqual(empty.value, 0)
+        with self.assertRaises(ValueError):
+            empty.last()
+
+        self.rows.append(row.RowData("-5", Date(1969, 3, 12), "comment9"))
+        self.assertEqual(self.rows.first_date, Date(1969, 3, 12))
+        self.assertEqual(self.rows.last_date, Date(1970, 3, 1))
+        self.assertEqual(self.rows.value, -50)
+
+        # The first of the rows with the last date is the last one
+        last = self.rows.last()
+        self.rows.append(row.RowData("-5", Date(1970, 3, 1), "comment10"))
+        self.assertIs(self.rows.last(), last)
+        later = row.RowData("-5", Date(1970, 3, 2), "comment11")
+        self.rows.append(later)
+        self.assertIs(self.rows.last(), later)
+
+    def test_check_value(self):
+        """The kept total can be checked against the rows"""
+        self.rows.rows[6].value = 11
+        self.assertEqual(self.rows.value, -45)
+
+        self.rows.check_value = True
+        with self.assertRaises(ValueError):
+            self.rows.value
+
     def test_load_file1(self):
         """Loading a file into an existing rowset requires a balance pragma
         """
@@ -144,7 +179,8 @@ apple 1970-03-20 comment24
         # FIXME - looking inside the object
         self.assertEqual(len(self.rows.rows), 13)
 
-        # FIXME - test appending a generator
+        self.rows.append(r for r in self.rows.rows[3:5])
+        self.assertEqual(len(self.rows.rows), 15)
 
         with self.assertRaises(ValueError):
             self.rows.append(None)
@@ -166,6 +202,15 @@ apple 1970-03-20 comment24
             rows
         )
 
+    def test_filter_compiled(self):
+        filters = [row.Filter('comment==comment1'), 'month==1970-01']
+
+        self.assertEqual(
+            # FIXME - looking inside the object
+            self.rows.filter(filters).rows,
+            self.rows.rows[6:7]
+        )
+
     def test_group_by(self):
         # TODO - should construct the expected dict and all its rows and
         # compare to that
@@ -189,6 +234,41 @@ apple 1970-03-20 comment24
             ]
         )
 
+    def test_group_by_memo(self):
+        stats = dict(rowset.group_by_stats)
+
+        first = self.rows.group_by('hashtag')
+        again = self.rows.group_by('hashtag')
+        self.assertEqual(again, first)
+        self.assertIs(again['bills:rent'], first['bills:rent'])
+        self.assertEqual(rowset.group_by_stats['hits'], stats['hits'] + 1)
+        self.assertEqual(rowset.group_by_stats['misses'], stats['misses'] + 1)
+
+        # Changing the returned dict does not change the remembered one
+        del again['bills:rent']
+        self.assertIn('bills:rent', self.rows.group_by('hashtag'))
+
+        # Appending forgets the old results
+        self.rows.append(row.RowData("-5", Date(1970, 4, 1), "#bills:rent"))
+        self.assertEqual(len(self.rows.group_by('hashtag')['bills:rent']), 3)
+
+    def test_group_by_memo_size(self):
+        self.rows.group_by_memo_size = 2
+        for field in ('month', 'hashtag', 'location'):
+            self.rows.group_by(field)
+        self.assertEqual(
+            list(self.rows._group_by_memo.keys()),
+            ['hashtag', 'location']
+        )
+
+        # The least recently used result is dropped
+        self.rows.group_by('hashtag')
+        self.rows.group_by('month')
+        self.assertEqual(
+            list(self.rows._group_by_memo.keys()),
+            ['hashtag', 'month']
+        )
+
     def test_forecast1(self):
         """By default, forecast should be false"""
         self.assertEqual(self.rows.isforecast, False)
@@ -203,6 +283,323 @@ apple 1970-03-20 comment24
         self.rows.load_file(f)
         self.assertEqual(self.rows.isforecast, True)
 
+    def test_running_balance(self):
+        self.rows.append(
+            row.RowData("-0.5", Date(1970, 4, 2), "comment9 !forecast")
+        )
+        data = self.rows.filter(['isdata==1'])
+
+        running = data.running_balance('month')
+        self.assertEqual(list(running.keys()), [
+            Date(1970, 1, 1),
+            Date(1970, 2, 1),
+            Date(1970, 3, 1),
+            Date(1970, 4, 1),
+        ])
+        for month, balance in running.items():
+            expected = data.filter(['month<=' + month.strftime('%Y-%m')])
+            self.assertEqual(str(balance.value), str(expected.value))
+            self.assertEqual(balance.isforecast, expected.isforecast)
+
+        self.assertEqual(str(running[Date(1970, 4, 1)].value), '-45.5')
+        self.assertEqual(running[Date(1970, 4, 1)].isforecast, True)
+
+        # Asking for other keys gives the balance at that point
+        running = data.running_balance('month', [
+            Date(1969, 1, 1),
+            Date(1970, 2, 15),
+        ])
+        self.assertEqual(running[Date(1969, 1, 1)].value, 0)
+        self.assertEqual(running[Date(1970, 2, 15)].value, -35)
+
+        # Or buckets of any other kind
+        running = data.running_balance(lambda row: row.date.year)
+        self.assertEqual(str(running[1970].value), '-45.5')
+
+    def test_period_balances(self):
+        self.rows.append(
+            row.RowData("-0.5", Date(1970, 4, 2), "comment9 !forecast")
+        )
+        data = self.rows.filter(['isdata==1'])
+
+        # The balance pragmas have no tax year
+        periods = self.rows.period_balances('taxyearhk')
+        self.assertEqual(list(periods.keys()), [None, 'ye1970', 'ye1971'])
+
+        periods = data.period_balances('taxyearhk')
+        for key, period in periods.items():
+            expected = data.filter(['taxyearhk<' + key])
+            self.assertEqual(str(period.opening.value), str(expected.value))
+            self.assertEqual(period.opening.isforecast, expected.isforecast)
+
+        self.assertEqual(periods['ye1970'].closing.value, -45)
+        self.assertEqual(periods['ye1971'].opening.value, -45)
+        self.assertEqual(str(periods['ye1971'].closing.value), '-45.5')
+        self.assertEqual(periods['ye1971'].closing.isforecast, True)
+
+        # The opening of the first period has nothing before it
+        periods = data.period_balances('month', [Date(1970, 1, 1)])
+        self.assertEqual(periods[Date(1970, 1, 1)].opening.value, 0)
+        self.assertEqual(periods[Date(1970, 1, 1)].closing.value, -25)
+
+
+class TestRowSetStats(unittest.TestCase):
+    def test_stats(self):
+        rows = rowset.RowSet()
+        rows.load_file(StringIO(TestRowSet.input_data))
+
+        stats = dict(rowset.rowset_stats)
+        rows.filter(['value>0'])
+        rows.autosplit(['value>0'])
+        rows.autosplit()
+        self.assertEqual(rowset.rowset_stats['filter_rowsets'],
+                         stats['filter_rowsets'] + 2)
+
+        groups = rows.group_by('month')
+        rows.group_by('month')
+        self.assertEqual(rowset.rowset_stats['group_by_rowsets'],
+                         stats['group_by_rowsets'] + len(groups))
+
+    def test_rows_by_file(self):
+        with tempfile.TemporaryDirectory() as dirname:
+            filename = os.path.join(dirname, '1970-01.txt')
+            with open(filename, 'w') as f:
+                f.write(TestRowSet.input_data)
+
+            rows = rowset.RowSet()
+            rows.load_directory(dirname)
+            self.assertEqual(rowset.rowset_stats['rows_by_file'][filename],
+                             len(rows))
+
+
+class TestRowSetIndex(unittest.TestCase):
+    input_data = TestRowSet.input_data + """-10 1970-03-05 comment7 !locn:test_location
+20 1970-04-05 comment8 #bills:rent !locn:test_location2
+"""
+
+    def setUp(self):
+        f = StringIO(self.input_data)
+        self.rows = rowset.RowSet()
+        self.rows.load_file(f)
+
+        f = StringIO(self.input_data)
+        self.indexed = rowset.RowSet()
+        self.indexed.index_by()
+        self.indexed.load_file(f)
+
+    def tearDown(self):
+        self.rows = None
+        self.indexed = None
+
+    def assertSameFilter(self, filters):
+        self.assertEqual(
+            str(self.indexed.filter(filters)),
+            str(self.rows.filter(filters))
+        )
+
+    def test_filter(self):
+        hits = rowset.index_stats['hits']
+
+        self.assertSameFilter(['hashtag==bills:rent'])
+        self.assertSameFilter(['hashtag=~water', 'value<-11'])
+        self.assertSameFilter(['location!=test_location'])
+        self.assertSameFilter(['isdata==1', 'month<=1970-02'])
+        self.assertSameFilter(['isdata==1', 'taxyearhk<ye1971'])
+
+        self.assertEqual(rowset.index_stats['hits'], hits + 3)
+
+    def test_filter_sorted(self):
+        data = self.indexed.filter(['isdata==1'])
+        expected = self.rows.filter(['isdata==1'])
+
+        for f in ('month<=1970-02', 'month<1970-02', 'month>1970-01',
+                  'month>=1970-03', 'date>1970-01-10', 'date<=1970-01-10',
+                  'date<1969-12', 'month>1971-01'):
+            self.assertEqual(str(data.filter([f])), str(expected.filter([f])))
+
+        # The derived RowSets keep the index settings
+        self.assertIn('date', data._indexes)
+
+    def test_filter_errors(self):
+        """The first filter sees the rows with no dates"""
+        with self.assertRaises(TypeError):
+            self.indexed.filter(['month<=1970-02'])
+
+    def test_group_by(self):
+        for field in ('month', 'hashtag', 'location', 'isforecast'):
+            got = self.indexed.group_by(field)
+            expected = self.rows.group_by(field)
+
+            self.assertEqual(list(got.keys()), list(expected.keys()))
+            for key in expected:
+                self.assertEqual(str(got[key]), str(expected[key]))
+
+    def test_append(self):
+        """An index that has been built is kept up to date"""
+        self.indexed.group_by('hashtag')
+        self.indexed.append(
+            row.RowData("-5", Date(1970, 5, 1), "comment9 #bills:rent")
+        )
+        self.assertEqual(len(self.indexed.group_by('hashtag')['bills:rent']), 4)
+        self.assertEqual(
+            len(self.indexed.filter(['hashtag==bills:rent'])), 4
+        )
+
+
+class TestLoadDirectory(unittest.TestCase):
+    files = {
+        '1970-01.txt': """#balance 0 Opening Balance
+10 1970-01-05 comment1
+-5 1970-01-10 comment2 #bills:rent
+""",
+        '1970-02.txt': """#balance 5
+20 1970-02-06 comment3
+""",
+        '1970-03.txt': """#balance 25
+-10 1970-03-01 comment4 #bills:water
+#balance 15 closing
+""",
+    }
+
+    def setUp(self):
+        self.dir = tempfile.TemporaryDirectory()
+        for name, data in self.files.items():
+            with open(os.path.join(self.dir.name, name), 'w') as f:
+                f.write(data)
+
+    def tearDown(self):
+        self.dir.cleanup()
+
+    def write(self, name, data):
+        filename = os.path.join(self.dir.name, name)
+        with open(filename, 'w') as f:
+            f.write(data)
+
+        # Make sure that the change is seen, however coarse the clock
+        stat = os.stat(filename)
+        os.utime(filename, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1000))
+        return filename
+
+    def assertReloaded(self, rows):
+        expected = rowset.RowSet()
+        expected.load_directory(self.dir.name)
+        self.assertEqual(str(rows), str(expected))
+        self.assertEqual(rows.value, expected.value)
+        self.assertEqual(rows.first_date, expected.first_date)
+        self.assertEqual(rows.last_date, expected.last_date)
+
+    def test_serial(self):
+        rows = rowset.RowSet()
+        rows.load_directory(self.dir.name)
+        expected = [self.files[x] for x in sorted(self.files.keys())]
+        self.assertEqual(str(rows), ''.join(expected))
+        self.assertEqual(rows.value, 15)
+
+    def test_read_once(self):
+        """The hash of each file comes from the text read for parsing"""
+        with mock.patch('rowset._file_digest') as digest:
+            rows = rowset.RowSet()
+            rows.load_directory(self.dir.name)
+            digest.assert_not_called()
+
+        self.assertEqual(rows.reload(), [])
+
+    def test_parallel(self):
+        serial = rowset.RowSet()
+        serial.load_directory(self.dir.name)
+
+        rows = rowset.RowSet()
+        rows.load_directory(self.dir.name, jobs=2)
+        self.assertEqual(str(rows), str(serial))
+        self.assertEqual(rows.value, 15)
+
+    def test_parallel_balance_error(self):
+        """A broken balance chain gives the same error either way"""
+        filename = os.path.join(self.dir.name, '1970-02.txt')
+        with open(filename, 'w') as f:
+            f.write("#balance 6\n")
+
+        errors = []
+        for jobs in (1, 2):
+            rows = rowset.RowSet()
+            with self.assertRaises(ValueError) as cm:
+                rows.load_directory(self.dir.name, jobs=jobs)
+            errors.append(str(cm.exception))
+
+        self.assertEqual(errors[0], errors[1])
+        self.assertEqual(
+            errors[0],
+            filename + ':1 Failed to balance - expected 6 but calculated 5'
+        )
+
+    def test_reload(self):
+        rows = rowset.RowSet()
+        rows.load_directory(self.dir.name)
+        rows.index_by(['month'])
+        rows.group_by('month')
+        self.assertEqual(rows.reload(), [])
+
+        filename = self.write('1970-02.txt', """#balance 5
+25 1970-02-06 comment3
+-5 1970-04-06 comment5
+""")
+        with mock.patch('rowset._parse_file',
+                        wraps=rowset._parse_file) as parse:
+            self.assertEqual(rows.reload(), [filename])
+            parse.assert_called_once_with(filename, None)
+        self.assertReloaded(rows)
+        self.assertEqual(len(rows.group_by('month')[Date(1970, 4, 1)]), 1)
+        self.assertEqual(len(rows.filter(['isdata==1', 'month==1970-04'])), 1)
+
+        # The balance chain is checked again for the later files
+        self.write('1970-02.txt', "#balance 5\n")
+        with self.assertRaises(ValueError):
+            rows.reload()
+        self.write('1970-03.txt', "#balance 5\n")
+        self.assertEqual(len(rows.reload()), 1)
+        self.assertReloaded(rows)
+        self.assertEqual(rows.value, 5)
+
+    def test_reload_touch(self):
+        """Files with the same contents are not parsed again"""
+        rows = rowset.RowSet()
+        rows.load_directory(self.dir.name)
+
+        self.write('1970-01.txt', self.files['1970-01.txt'])
+        self.assertEqual(rows.reload(), [])
+
+    def test_reload_add_remove(self):
+        rows = rowset.RowSet()
+        rows.load_directory(self.dir.name)
+
+        filename = self.write('1970-04.txt', """#balance 15
+1 1970-04-01 comment5
+""")
+        self.assertEqual(rows.reload(), [filename])
+        self.assertReloaded(rows)
+        self.assertEqual(rows.value, 16)
+
+        os.unlink(filename)
+        self.assertEqual(rows.reload(), [filename])
+        self.assertReloaded(rows)
+        self.assertEqual(rows.value, 15)
+
+    def test_loaded_from(self):
+        future = os.path.join(self.dir.name, 'future')
+        os.mkdir(future)
+        with open(os.path.join(future, '1970-05.txt'), 'w') as f:
+            f.write("1 1970-05-01 comment6\n")
+
+        rows = rowset.RowSet()
+        rows.load_directory(self.dir.name)
+        main = str(rows)
+        rows.load_directory(future, skip_balance_check=True)
+
+        self.assertEqual(len(rows), 9)
+        self.assertEqual(str(rows.loaded_from(self.dir.name)), main)
+        self.assertEqual(str(rows.loaded_from(future)),
+                         "1 1970-05-01 comment6\n")
+
 
 class TestFilterForecast(unittest.TestCase):
     input_data = """
@@ -267,6 +664,18 @@ class TestFilterForecast(unittest.TestCase):
         got = self.rows.filter_forecast()
         self.assertEqual(15, len(got))
 
+    def test_keep_order(self):
+        got = self.rows.filter_forecast(keep_order=True)
+        self.assertEqual(
+            [str(i.value) for i in got],
+            ['11', '12', '13', '14', '15', '16', '17', '18', '20', '21',
+             '22', '23', '24', '26', '25']
+        )
+        self.assertEqual(
+            sorted(str(got).split("\n")),
+            sorted(str(self.rows.filter_forecast()).split("\n"))
+        )
+
     def test_class(self):
         got = self.rows.filter_forecast()
         for i in got:
@@ -293,6 +702,32 @@ class TestAutoSplit(unittest.TestCase):
         self.assertEqual(len(rows), 9)
         self.assertEqual(len(rows.autosplit()), 18)
 
+    def test_filter(self):
+        """Filtering while splitting is the same as filtering afterwards"""
+        input_data = """#balance 0
+100  1980-01-01 incoming comment
+100  1984-02-29 !months:-1:5
+100  1984-01-31 !months:4 #test_hashtag
+-5   1984-03-01 #test_hashtag !forecast:monthly:until:1984-06-01
+"""
+        rows = rowset.RowSet()
+        rows.load_file(StringIO(input_data))
+
+        for filters in (
+                None,
+                ['isdata==1', 'month==1984-03'],
+                ['value>20'],
+                ['hashtag==test_hashtag', 'month>=1984-04'],
+        ):
+            self.assertEqual(
+                str(rows.autosplit(filters)),
+                str(rows.autosplit().filter(filters))
+            )
+
+        got = rows.iter_autosplit()
+        self.assertEqual(str(next(got)), '#balance 0')
+        self.assertEqual(str(next(got)), '100 1980-01-01 incoming comment')
+
     def test_leapday(self):
         """We can split a leap day, if it is the original row date"""
         input_data = """
@@ -436,6 +871,38 @@ class TestAutoSplit(unittest.TestCase):
 
         self.assertEqual(expected, got)
 
+    def test_forecast_window(self):
+        input_data = """
+#balance 0
+100  1980-05-05 !forecast:monthly:until:1980-10-01
+100  1980-07-06 !forecast:monthly:until:1980-06-01
+"""
+
+        rows = rowset.RowSet()
+        rows.load_file(StringIO(input_data))
+
+        def autosplit(window):
+            return str(rows.autosplit(window=window))
+
+        # The months that overlap the window are kept
+        got = autosplit((Date(1980, 6, 30), Date(1980, 8, 1)))
+
+        expected = """
+#balance 0
+100 1980-06-05 !forecast:child:until:1980-10-01
+100 1980-07-05 !forecast:child:until:1980-10-01
+100 1980-08-05 !forecast:child:until:1980-10-01
+100 1980-07-06 !forecast:monthly:until:1980-06-01
+"""
+
+        self.assertEqual(expected, got)
+
+        got = autosplit((None, Date(1980, 5, 31)))
+        self.assertEqual(got.count('child'), 1)
+
+        got = autosplit((Date(1980, 11, 1), None))
+        self.assertEqual(got.count('child'), 0)
+
 
 class TestLocn(unittest.TestCase):
     input_data = """
@@ -530,3 +997,37 @@ class TestRowGrid(unittest.TestCase):
 
         column = self.grid._headings_x[Date(1970, 1, 1)]
         self.assertEqual(column.isforecast, False)
+
+    def test_totals(self):
+        self.assertEqual(self.grid.rows['bills:water'][Date(1970, 1, 1)].value,
+                         -25)
+        self.assertEqual(self.grid._headings_x[Date(1970, 1, 1)].value, -25)
+        self.assertEqual(self.grid._headings_y['bills:rent'].value, -20)
+        self.assertEqual(self.grid._headings_y['bills:rent'].isforecast, True)
+
+    def test_sorted(self):
+        self.assertEqual(
+            self.grid.headings_x_sorted,
+            [Date(1970, 1, 1), Date(1970, 2, 1), Date(1970, 3, 1)]
+        )
+        self.assertEqual(
+            self.grid.headings_y_sorted,
+            ['bills:rent', 'bills:water', 'unknown']
+        )
+
+    def test_keep_rows(self):
+        """The grid can keep all the rows for each cell"""
+        rows = rowset.RowSet()
+        rows.load_file(StringIO(self.input_data))
+        grid = rows.filter(['isdata==1']).grid_by('month', 'hashtag', True)
+
+        for tag, cells in self.grid.rows.items():
+            for month, cell in cells.items():
+                self.assertIsInstance(grid.rows[tag][month], rowset.RowSet)
+                self.assertEqual(grid.rows[tag][month].value, cell.value)
+                self.assertEqual(grid.rows[tag][month].isforecast,
+                                 cell.isforecast)
+
+        self.assertEqual(str(grid._headings_y['unknown']),
+                         "-10 1970-02-06 comment4\n10 1970-01-05 comment1\n")
+        self.assertEqual(grid.headings_y_width, 11)
@@ -0,0 +1,93 @@
+""" Perform tests on the tagschema.py
+"""
+
+import unittest
+import sys
+import os
+
+from io import StringIO
+
+# Ensure that we look for any modules in our local lib dir.  This allows simple
+# testing and development use.  It also does not break the case where the lib
+# has been installed properly on the normal sys.path
+sys.path.insert(0,
+                os.path.join(os.path.dirname(os.path.abspath(__file__)), 'lib')
+                )
+# I would use site.addsitedir, but it does an append, not insert
+
+import tagschema # noqa
+
+
+class TestTagSchema(unittest.TestCase):
+    input_data = """
+# A comment line
+hashtag bills:rent
+hashtag dues:[a-z]+
+
+bangtag forecast(:.*)?
+"""
+
+    def setUp(self):
+        self.schema = tagschema.TagSchema()
+        self.schema.load_file(StringIO(self.input_data))
+
+    def tearDown(self):
+        self.schema = None
+
+    def test_patterns(self):
+        self.assertEqual(self.schema.patterns, {
+            '#': ['bills:rent', 'dues:[a-z]+'],
+            '!': ['forecast(:.*)?'],
+        })
+
+    def test_validate(self):
+        self.schema.validate('#', 'bills:rent')
+        self.schema.validate('#', 'dues:alice')
+        self.schema.validate('!', 'forecast:monthly')
+
+        # must match the whole tag
+        with self.assertRaises(ValueError):
+            self.schema.validate('#', 'bills:rent:extra')
+        with self.assertRaises(ValueError):
+            self.schema.validate('#', 'dues:')
+
+        # and the patterns are separate for each tag type
+        with self.assertRaises(ValueError):
+            self.schema.validate('!', 'bills:rent')
+
+        with self.assertRaises(ValueError):
+            self.schema.validate('?', 'bills:rent')
+
+    def test_cached_verdict(self):
+        with self.assertRaises(ValueError):
+            self.schema.validate('#', 'fridge')
+        with self.assertRaises(ValueError):
+            self.schema.validate('#', 'fridge')
+
+        # adding a pattern must not leave a stale verdict behind
+        self.schema.add('#', 'fridge')
+        self.schema.validate('#', 'fridge')
+
+        with self.assertRaises(ValueError):
+            self.schema.add('?', 'fridge')
+
+    def test_load_bad_type(self):
+        with self.assertRaises(ValueError):
+            self.schema.load_file(StringIO("flubbertag fridge\n"))
+
+    def test_default(self):
+        schema = tagschema.default()
+        self.assertIs(schema, tagschema.default())
+
+        schema.validate('#', 'bills:rent')
+        schema.validate('!', 'months:-1:5')
+
+    def test_stats(self):
+        stats = dict(tagschema.tagschema_stats)
+        self.schema.validate('#', 'bills:rent')
+        self.schema.validate('#', 'dues:alice')
+        self.schema.validate('!', 'forecast')
+
+        # one matcher is compiled for each type of tag used
+        self.assertEqual(tagschema.tagschema_stats['regex_compilations'],
+                         stats['regex_compilations'] + 2)
@@ -0,0 +1,83 @@
+""" Perform tests on the timing.py
+"""
+
+import unittest
+import tempfile
+import tracemalloc
+import sys
+import os
+
+# Ensure that we look for any modules in our local lib dir.  This allows simple
+# testing and development use.  It also does not break the case where the lib
+# has been installed properly on the normal sys.path
+sys.path.insert(0,
+                os.path.join(os.path.dirname(os.path.abspath(__file__)), 'lib')
+                )
+# I would use site.addsitedir, but it does an append, not insert
+
+import timing # noqa
+
+
+class TestTiming(unittest.TestCase):
+    def tearDown(self):
+        timing.stop()
+
+    def test_not_started(self):
+        with timing.stage('nothing') as stage:
+            self.assertIsNone(stage)
+        self.assertIsNone(timing.stop())
+
+    def test_stages(self):
+        timer = timing.start()
+        with timing.stage('outer'):
+            with timing.stage('inner'):
+                data = bytearray(1024 * 1024)
+            del data
+        with timing.stage('after'):
+            pass
+        self.assertIs(timing.stop(), timer)
+
+        self.assertEqual(
+            [(s['name'], s['depth']) for s in timer.as_list()],
+            [('outer', 0), ('inner', 1), ('after', 0)]
+        )
+        # The memory tracing is not left running
+        self.assertFalse(tracemalloc.is_tracing())
+        outer, inner, after = timer.stages
+        self.assertGreaterEqual(outer.seconds, inner.seconds)
+        self.assertGreaterEqual(inner.peak, 1024 * 1024)
+        self.assertGreaterEqual(outer.peak, inner.peak)
+        if hasattr(tracemalloc, 'reset_peak'):
+            self.assertLess(after.peak, 1024 * 1024)
+
+        table = timer.table().splitlines()
+        self.assertEqual(len(table), 4)
+        self.assertTrue(table[2].startswith('  inner '))
+
+        # The stages are no longer timed once stopped
+        with timing.stage('stopped'):
+            pass
+        self.assertEqual(len(timer.stages), 3)
+
+    def test_dump(self):
+        with tempfile.TemporaryDirectory() as dirname:
+            timing.start(os.path.join(dirname, 'profile'))
+            with timing.stage('load'):
+                with timing.stage('sub stage'):
+                    sum(range(100))
+            timing.stop()
+
+            self.assertEqual(
+                sorted(os.listdir(os.path.join(dirname, 'profile'))),
+                ['000-load.pstats', '001-sub_stage.pstats']
+            )
+
+    def test_already_tracing(self):
+        tracemalloc.start()
+        try:
+            timing.start()
+            timing.stop()
+            # The tracing that was already running is left alone
+            self.assertTrue(tracemalloc.is_tracing())
+        finally:
+            tracemalloc.stop()
@@ -0,0 +1,158 @@
+# Licensed under GPLv3
+import contextlib
+import os
+import time
+
+
+class Stage(object):
+    """The measurements of one named stage of the work"""
+    __slots__ = ('name', 'depth', 'seconds', 'peak')
+
+    def __init__(self, name, depth):
+        self.name = name
+        self.depth = depth
+        self.seconds = None
+        # The most memory allocated at any time during the stage, in bytes
+        self.peak = 0
+
+    def as_dict(self):
+        return {
+            'name': self.name,
+            'depth': self.depth,
+            'seconds': self.seconds,
+            'peak_bytes': self.peak,
+        }
+
+
+class Timer(object):
+    """Record the wall time and memory peak of each stage of the work, and
+    optionally a cProfile of each stage, saved into dump_dir.
+
+    Stages may be inside other stages, when the outer stage time includes
+    the inner ones.  Tracing the memory use slows python down, so the
+    times are only useful for comparing the stages of one run.  Before
+    python 3.9 the memory peak cannot be reset, so each stage reports the
+    highest peak seen so far.
+    """
+
+    def __init__(self, dump_dir=None):
+        import tracemalloc
+
+        self.stages = []
+        self.dump_dir = dump_dir
+        self._stack = []
+        self._tracemalloc = tracemalloc
+        # Only the memory tracing started here is stopped again here
+        self._started_tracing = not tracemalloc.is_tracing()
+        if self._started_tracing:
+            tracemalloc.start()
+
+    def stop(self):
+        """Stop tracing the memory use, if this Timer started it
+        """
+        if self._started_tracing:
+            self._tracemalloc.stop()
+            self._started_tracing = False
+
+    def _peak(self):
+        return self._tracemalloc.get_traced_memory()[1]
+
+    @contextlib.contextmanager
+    def stage(self, name):
+        current = Stage(name, len(self._stack))
+        index = len(self.stages)
+        self.stages.append(current)
+
+        parent = None
+        if self._stack:
+            parent = self._stack[-1]
+            # The peak so far belongs to the outer stage
+            parent[0].peak = max(parent[0].peak, self._peak())
+        if hasattr(self._tracemalloc, 'reset_peak'):
+            self._tracemalloc.reset_peak()
+
+        profile = None
+        if self.dump_dir is not None:
+            import cProfile
+
+            # Only one profiler can be running at a time
+            if parent is not None and parent[1] is not None:
+                parent[1].disable()
+            profile = cProfile.Profile()
+            profile.enable()
+
+        self._stack.append((current, profile))
+        start = time.perf_counter()
+        try:
+            yield current
+        finally:
+            current.seconds = time.perf_counter() - start
+            current.peak = max(current.peak, self._peak())
+            self._stack.pop()
+
+            if profile is not None:
+                profile.disable()
+                filename = '{:03}-{}.pstats'.format(
+                    index,
+                    name.replace(' ', '_').replace('/', '_'),
+                )
+                os.makedirs(self.dump_dir, exist_ok=True)
+                profile.dump_stats(os.path.join(self.dump_dir, filename))
+                if parent is not None and parent[1] is not None:
+                    parent[1].enable()
+
+            if parent is not None:
+                parent[0].peak = max(parent[0].peak, current.peak)
+
+    def table(self):
+        """Return the stages as a human readable table
+        """
+        lines = ["{:<32} {:>10} {:>12}".format('stage', 'ms', 'peak KiB')]
+        for stage in self.stages:
+            lines.append("{:<32} {:>10.2f} {:>12.1f}".format(
+                '  ' * stage.depth + stage.name,
+                (stage.seconds or 0) * 1000,
+                stage.peak / 1024,
+            ))
+        return "\n".join(lines)
+
+    def as_list(self):
+        return [stage.as_dict() for stage in self.stages]
+
+
+# The Timer in use, if the stages are being timed at all
+_timer = None
+
+
+def start(dump_dir=None):
+    """Start timing the stages, returning the Timer used
+    """
+    global _timer
+    _timer = Timer(dump_dir)
+    return _timer
+
+
+def stop():
+    """Stop timing the stages, returning the Timer that was used
+    """
+    global _timer
+    timer = _timer
+    _timer = None
+    if timer is not None:
+        timer.stop()
+    return timer
+
+
+@contextlib.contextmanager
+def _not_timed():
+    # contextlib.nullcontext() is only in python 3.7 and later
+    yield None
+
+
+def stage(name):
+    """Return a context manager that times the named stage of the work, if
+    the stages are being timed
+    """
+    if _timer is None:
+        return _not_timed()
+    return _timer.stage(name)
@@ -3,9 +3,13 @@
 """
 
 import unittest
+import argparse
 import datetime
 from datetime import date as Date
 import json
+import tempfile
+import threading
+import os
 
 from unittest import mock  # pragma: no cover
 from io import StringIO
@@ -37,6 +41,101 @@ class TestTime(unittest.TestCase):
             )
 
 
+class TestImportTime(unittest.TestCase):
+
+    def test_report(self):
+        lines = [
+            "import time: self [us] | cumulative | imported package",
+            "import time:       100 |        100 |   _b",
+            "import time:      1000 |       1100 | a",
+            "import time:       300 |        300 | c",
+            "something else",
+        ]
+        self.assertEqual(balance.importtime_report(lines, 2).split("\n"), [
+            "Total import time: 1.4 ms",
+            "   self ms   total ms  module",
+            "       1.0        1.1  a",
+            "       0.3        0.3  c",
+        ])
+
+
+class TestStatsJson(unittest.TestCase):
+
+    def test_write(self):
+        with tempfile.TemporaryDirectory() as dirname:
+            filename = os.path.join(dirname, 'stats.json')
+            balance.write_stats_json(filename)
+            with open(filename) as f:
+                stats = json.load(f)
+
+        self.assertEqual(sorted(stats),
+                         ['group_by', 'index', 'row', 'rowset', 'tagschema'])
+        self.assertIn('regex_compilations', stats['tagschema'])
+        self.assertIn('filter_evaluations', stats['row'])
+        self.assertIn('rows_by_file', stats['rowset'])
+
+    @mock.patch('sys.stderr', new_callable=StringIO)
+    def test_stderr(self, mock_stderr):
+        balance.write_stats_json('-')
+        self.assertEqual(json.loads(mock_stderr.getvalue()),
+                         json.loads(json.dumps(balance.work_stats())))
+
+
+class TestProfileArgs(unittest.TestCase):
+
+    def test_profile(self):
+        argparser = balance.build_argparser()
+
+        # The subcommand is not taken as the format
+        args = argparser.parse_args(['--profile', 'sum'])
+        self.assertTrue(args.profile)
+        self.assertEqual(args.profile_format, 'table')
+        self.assertEqual(args.cmd, 'sum')
+
+        args = argparser.parse_args(['--profile', '--profile_format', 'json',
+                                     'grid'])
+        self.assertEqual(args.profile_format, 'json')
+
+
+class TestJinja2Env(unittest.TestCase):
+
+    def test_shared(self):
+        env = balance.jinja2_env()
+        self.assertIs(balance.jinja2_env(), env)
+        self.assertIsNone(env.bytecode_cache)
+
+    def test_bytecode_cache(self):
+        with tempfile.TemporaryDirectory() as dirname:
+            with mock.patch.dict(os.environ, {'XDG_CACHE_HOME': dirname}), \
+                    mock.patch.dict(balance._jinja2_envs, clear=True):
+                args = argparse.Namespace(cache_enable=True, cache_dir=None)
+                env = balance.jinja2_env(balance.jinja2_cache_dirname(args))
+                env.get_template('topay.txt.j2')
+
+                cachedir = os.path.join(dirname, 'dsl-accounts', 'jinja2')
+                self.assertEqual(len(os.listdir(cachedir)), 1)
+
+    def test_cache_dirname(self):
+        args = argparse.Namespace(cache_enable=False, cache_dir='/a')
+        self.assertIsNone(balance.jinja2_cache_dirname(args))
+
+        args.cache_enable = True
+        self.assertEqual(balance.jinja2_cache_dirname(args),
+                         os.path.join('/a', 'jinja2'))
+
+    def test_bytecode_cache_unwritable(self):
+        with tempfile.TemporaryDirectory() as dirname, \
+                mock.patch.dict(balance._jinja2_envs, clear=True):
+            env = balance.jinja2_env(dirname)
+            with mock.patch('jinja2.FileSystemBytecodeCache.load_bytecode',
+                            side_effect=PermissionError), \
+                    mock.patch('jinja2.FileSystemBytecodeCache.dump_bytecode',
+                               side_effect=PermissionError):
+                # The template still renders without the cache
+                tpl = env.get_template('topay.txt.j2')
+            self.assertIsNotNone(tpl)
+
+
 class TestSubp(unittest.TestCase):
     input_data = """
 #balance 0 Opening Balance
@@ -326,3 +425,135 @@ class TestSubp(unittest.TestCase):
 
         got = balance.subp_report_location(self).split("\n")
         self.assertEqual(got, expect)
+
+    def test_subp_cache_clear(self):
+        with tempfile.TemporaryDirectory() as dirname:
+            cache = balance.RowCache(dirname)
+            cache.put(self.input_data, [])
+
+            args = argparse.Namespace(cache_dir=dirname)
+            got = balance.subp_cache_clear(args)
+            self.assertEqual(got, "Removed 1 cache entries")
+            self.assertEqual(cache.get(self.input_data), None)
+
+
+class TestServe(unittest.TestCase):
+    input_data = """#balance 0 Opening Balance
+500 1990-04-03 #dues:test1
+-12 1990-04-15 #bills:rent !months:2
+"""
+
+    def setUp(self):
+        self.dir = tempfile.TemporaryDirectory()
+        with open(os.path.join(self.dir.name, '1990-04.txt'), 'w') as f:
+            f.write(self.input_data)
+        self.ledger = balance.Ledger(self.dir.name)
+        self.argparser = balance.build_argparser()
+
+    def tearDown(self):
+        balance.set_asof(None)
+        self.dir.cleanup()
+
+    def test_serve_one(self):
+        got = balance.serve_one(self.argparser, self.ledger, ['sum'])
+        self.assertEqual(got, {'result': '488'})
+
+        got = balance.serve_one(self.argparser, self.ledger,
+                                ['--filter', 'value>0', 'sum'])
+        self.assertEqual(got, {'result': '500'})
+
+        got = balance.serve_one(self.argparser, self.ledger, ['serve'])
+        self.assertEqual(got, {'error': 'ValueError: The server is already running'})  # noqa
+
+        got = balance.serve_one(self.argparser, self.ledger, ['cache_clear'])
+        self.assertEqual(got, {'error': 'ValueError: Run cache_clear without the --socket'})  # noqa
+
+        got = balance.serve_one(self.argparser, self.ledger,
+                                ['multi', 'sum=x'])
+        self.assertEqual(got, {'error': 'ValueError: Run multi without the --socket'})  # noqa
+
+        with mock.patch('sys.stderr', new_callable=StringIO):
+            got = balance.serve_one(self.argparser, self.ledger, ['flubber'])
+        self.assertEqual(got, {'error': 'Bad commandline: flubber'})
+
+    def test_serve_one_options(self):
+        options = balance.load_options(
+            self.argparser.parse_args(['--dir', self.dir.name, 'serve'])
+        )
+
+        # A relative dir is from the cwd of the client
+        parent, name = os.path.split(self.dir.name)
+        got = balance.serve_one(self.argparser, self.ledger,
+                                ['--dir', name, 'sum'], options, parent)
+        self.assertEqual(got, {'result': '488'})
+
+        got = balance.serve_one(self.argparser, self.ledger,
+                                ['--dir', '/nonexistent', '--columnar', 'sum'],
+                                options)
+        self.assertEqual(got, {'error': 'ValueError: The server loaded the data with different dir, columnar'})  # noqa
+
+    def test_client(self):
+        path = os.path.join(self.dir.name, 'socket')
+        options = balance.load_options(
+            self.argparser.parse_args(['--dir', self.dir.name, 'serve'])
+        )
+        with balance.make_server(path, self.ledger, options) as server:
+            thread = threading.Thread(target=server.handle_request)
+            thread.start()
+            got = balance.client(path, ['--dir', self.dir.name, '--nosplit',
+                                        'roundtrip'])
+            thread.join()
+
+            self.assertEqual(got, {'result': self.input_data})
+
+            with self.assertRaises(RuntimeError):
+                balance.make_server(path, self.ledger)
+
+    def test_multi(self):
+        sum_file = os.path.join(self.dir.name, 'sum')
+        csv_file = os.path.join(self.dir.name, 'csv')
+        args = self.argparser.parse_args([
+            'multi',
+            sum_file + '=sum',
+            csv_file + '=roundtrip --nosplit --filter=value<0',
+        ])
+
+        got = balance.run(args, self.ledger)
+        self.assertEqual(got, 'Wrote {} {}'.format(sum_file, csv_file))
+        with open(sum_file) as f:
+            self.assertEqual(f.read(), '488\n')
+        with open(csv_file) as f:
+            self.assertEqual(f.read(), '-12 1990-04-15 #bills:rent !months:2\n\n')  # noqa
+
+        # Commas and "=" can be used in the option values
+        args = self.argparser.parse_args([
+            'multi',
+            csv_file + '=roundtrip --nosplit "--filter=comment=~a,b|rent"',
+        ])
+        balance.run(args, self.ledger)
+        with open(csv_file) as f:
+            self.assertEqual(f.read(), '-12 1990-04-15 #bills:rent !months:2\n\n')  # noqa
+
+        for target in ('sum', '=sum', sum_file + '=',
+                       'grid --display_days_prev=270',
+                       sum_file + '=serve'):
+            args = self.argparser.parse_args(['multi', target])
+            with self.assertRaises(ValueError):
+                balance.run(args, self.ledger)
+
+        # The other targets are still written when one fails
+        os.unlink(sum_file)
+        args = self.argparser.parse_args(['multi',
+                                          csv_file + '=sum --filter=value<0',
+                                          sum_file + '=sum'])
+        with mock.patch('sys.stderr', new_callable=StringIO):
+            with self.assertRaises(RuntimeError):
+                balance.run(args, self.ledger)
+        self.assertTrue(os.path.exists(sum_file))
+
+    def test_run_asof(self):
+        args = self.argparser.parse_args(['--asof', '1990-05-04', 'sum'])
+        balance.run(args, self.ledger)
+
+        # The date used for the run does not outlive it
+        self.assertEqual(balance.set_asof(None), None)